@@ -0,0 +1,142 @@
+import asyncio
+import os
+from collections import deque
+from typing import Deque, Dict, Optional
+
+from fastapi import HTTPException, Request
+
+# Admission control is opt-in; set ADMISSION_MAX_CONCURRENT to enable it
+ADMISSION_MAX_CONCURRENT = int(os.getenv("ADMISSION_MAX_CONCURRENT", "0"))
+ADMISSION_BATCH_MAX_CONCURRENT = int(os.getenv("ADMISSION_BATCH_MAX_CONCURRENT", "0"))
+ADMISSION_SINGLE_QUEUE = int(os.getenv("ADMISSION_SINGLE_QUEUE", "64"))
+ADMISSION_BATCH_QUEUE = int(os.getenv("ADMISSION_BATCH_QUEUE", "8"))
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "5"))
+ADMISSION_RETRY_AFTER = int(os.getenv("ADMISSION_RETRY_AFTER", "1"))
+
+# Lanes in priority order: freed slots go to waiting single checks first
+LANES = ("single", "batch")
+
+
+class AdmissionController:
+    """
+    Caps concurrent compliance evaluations per worker.
+
+    Requests that cannot start immediately wait in a bounded per-lane queue.
+    A full queue is rejected at once with 429; a request still queued after
+    `queue_timeout` seconds is rejected with 503. Batch checks may use at most
+    `batch_max_concurrent` slots, so single checks always have room.
+    """
+
+    def __init__(
+        self,
+        max_concurrent: int,
+        batch_max_concurrent: int = 0,
+        single_queue: int = ADMISSION_SINGLE_QUEUE,
+        batch_queue: int = ADMISSION_BATCH_QUEUE,
+        queue_timeout: float = ADMISSION_QUEUE_TIMEOUT,
+        retry_after: int = ADMISSION_RETRY_AFTER,
+    ):
+        self.max_concurrent = max_concurrent
+        self.lane_limits = {
+            "single": max_concurrent,
+            "batch": batch_max_concurrent or max(1, max_concurrent // 2),
+        }
+        self.queue_limits = {"single": single_queue, "batch": batch_queue}
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+
+        self._active: Dict[str, int] = {lane: 0 for lane in LANES}
+        self._waiters: Dict[str, Deque[asyncio.Future]] = {lane: deque() for lane in LANES}
+        self._admitted: Dict[str, int] = {lane: 0 for lane in LANES}
+        self._rejected_queue_full: Dict[str, int] = {lane: 0 for lane in LANES}
+        self._rejected_timeout: Dict[str, int] = {lane: 0 for lane in LANES}
+
+    def _can_start(self, lane: str) -> bool:
+        return sum(self._active.values()) < self.max_concurrent and self._active[lane] < self.lane_limits[lane]
+
+    def _has_priority_waiters(self, lane: str) -> bool:
+        for other in LANES:
+            if self._waiters[other]:
+                return True
+            if other == lane:
+                return False
+        return False
+
+    def _reject(self, status_code: int, detail: str) -> HTTPException:
+        return HTTPException(
+            status_code=status_code,
+            detail=detail,
+            headers={"Retry-After": str(self.retry_after)},
+        )
+
+    async def acquire(self, lane: str) -> None:
+        """Wait for an evaluation slot in `lane`, or raise HTTPException 429/503"""
+        if self._can_start(lane) and not self._has_priority_waiters(lane):
+            self._start(lane)
+            return
+
+        if len(self._waiters[lane]) >= self.queue_limits[lane]:
+            self._rejected_queue_full[lane] += 1
+            raise self._reject(429, "Too many compliance checks queued, retry later")
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiters[lane].append(future)
+        try:
+            await asyncio.wait({future}, timeout=self.queue_timeout)
+        except asyncio.CancelledError:
+            # Client went away: give back the slot if we were handed one meanwhile
+            if future.done():
+                self.release(lane)
+            else:
+                self._waiters[lane].remove(future)
+            raise
+        if not future.done():
+            self._waiters[lane].remove(future)
+            self._rejected_timeout[lane] += 1
+            raise self._reject(503, "Compliance checks are overloaded, retry later")
+
+    def release(self, lane: str) -> None:
+        self._active[lane] -= 1
+        self._dispatch()
+
+    def _start(self, lane: str) -> None:
+        self._active[lane] += 1
+        self._admitted[lane] += 1
+
+    def _dispatch(self) -> None:
+        for lane in LANES:
+            waiters = self._waiters[lane]
+            while waiters and self._can_start(lane):
+                self._start(lane)
+                waiters.popleft().set_result(None)
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        return {
+            "active": dict(self._active),
+            "queued": {lane: len(self._waiters[lane]) for lane in LANES},
+            "admitted": dict(self._admitted),
+            "rejected_queue_full": dict(self._rejected_queue_full),
+            "rejected_timeout": dict(self._rejected_timeout),
+        }
+
+
+def create_admission_controller() -> Optional[AdmissionController]:
+    """Build the controller from the environment, or None when disabled"""
+    if ADMISSION_MAX_CONCURRENT <= 0:
+        return None
+    return AdmissionController(ADMISSION_MAX_CONCURRENT, ADMISSION_BATCH_MAX_CONCURRENT)
+
+
+def admit(lane: str):
+    """Dependency that holds an evaluation slot in `lane` for the duration of the request"""
+    async def dependency(request: Request):
+        controller: Optional[AdmissionController] = request.app.state.admission
+        if controller is None:
+            yield
+            return
+        await controller.acquire(lane)
+        try:
+            yield
+        finally:
+            controller.release(lane)
+    return dependency
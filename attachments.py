@@ -0,0 +1,63 @@
+import hashlib
+import os
+import tempfile
+from typing import AsyncIterator, Tuple
+
+from starlette.concurrency import run_in_threadpool
+
+# Local directory holding attachment contents, addressed by SHA-256
+ATTACHMENT_STORAGE_DIR = os.getenv("ATTACHMENT_STORAGE_DIR", "attachments")
+ATTACHMENT_MAX_BYTES = int(os.getenv("ATTACHMENT_MAX_BYTES", str(100 * 1024 * 1024)))
+
+
+class AttachmentTooLarge(Exception):
+    """Raised when an upload exceeds the configured size limit"""
+
+
+class AttachmentStore:
+    """
+    Content-addressed file store for consignment attachments.
+
+    Uploads are written to a temporary file chunk by chunk while being hashed,
+    then moved to `<root>/<hash[:2]>/<hash>`. Identical content uploaded for
+    any consignment is stored once.
+    """
+
+    def __init__(self, root: str = ATTACHMENT_STORAGE_DIR, max_bytes: int = ATTACHMENT_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+
+    def path(self, sha256: str) -> str:
+        return os.path.join(self.root, sha256[:2], sha256)
+
+    async def save(self, chunks: AsyncIterator[bytes]) -> Tuple[str, int]:
+        """Store a stream of bytes and return its (sha256, size)"""
+        tmp_dir = os.path.join(self.root, "tmp")
+        os.makedirs(tmp_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+
+        hasher = hashlib.sha256()
+        size = 0
+        try:
+            with os.fdopen(fd, "wb") as f:
+                async for chunk in chunks:
+                    size += len(chunk)
+                    if size > self.max_bytes:
+                        raise AttachmentTooLarge(f"Attachment exceeds {self.max_bytes} bytes")
+                    hasher.update(chunk)
+                    await run_in_threadpool(f.write, chunk)
+
+            sha256 = hasher.hexdigest()
+            path = self.path(sha256)
+            if os.path.exists(path):
+                # Same content is already stored
+                os.remove(tmp_path)
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        return sha256, size
@@ -0,0 +1,124 @@
+"""
+Compare per-request commits against group commit for compliance verdict updates.
+
+Each worker thread repeatedly writes a verdict for one of its own seeded
+consignments, either committing on its own session (the default write path)
+or through a GroupCommitter and waiting for its group to commit. Reports
+throughput and latency percentiles for both modes.
+
+Usage:
+    DATABASE_URL=postgresql://... python benchmarks/group_commit_bench.py --threads 32 --updates 200
+"""
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+from typing import List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import get_sessionmaker, init_db
+from models import Consignment
+from schemas import ConsignmentStatus
+from group_commit import GroupCommitter
+from repository import SQLRepository
+
+VIOLATIONS = [{
+    "rule_id": "bench",
+    "description": "Benchmark violation",
+    "resolution_steps": "None",
+    "condition_str": "customs_value < 50000",
+}]
+
+
+def seed_consignments(count: int) -> List:
+    db = get_sessionmaker()()
+    try:
+        consignments = [
+            Consignment(
+                status=ConsignmentStatus.PENDING,
+                items=[{"name": "Bench item", "value": 100.0, "weight": 1.0, "requires_clearance": False}],
+                destination="Germany",
+                customs_value=100,
+                attachments=[],
+                violations=[],
+            )
+            for _ in range(count)
+        ]
+        db.add_all(consignments)
+        db.commit()
+        return [consignment.id for consignment in consignments]
+    finally:
+        db.close()
+
+
+def run(name: str, group_committer: Optional[GroupCommitter], ids: List, threads: int, updates: int) -> None:
+    """
+    Each thread saves verdicts for its own slice of the consignments through
+    SQLRepository.save_verdict, the endpoint's write path. As in the endpoint,
+    the consignment is loaded first; only saving it (and releasing the
+    session) is timed, in both modes.
+    """
+    session_factory = get_sessionmaker()
+    latencies: List[float] = []
+    lock = threading.Lock()
+
+    def worker(offset: int) -> None:
+        # Distinct ids per thread, so concurrent updates never target the same row
+        own_ids = ids[offset::threads]
+        local: List[float] = []
+        for i in range(updates):
+            db = session_factory()
+            consignment = db.get(Consignment, own_ids[i % len(own_ids)])
+            status = ConsignmentStatus.FLAGGED if i % 2 else ConsignmentStatus.VERIFIED
+            start = time.perf_counter()
+            SQLRepository(db, group_committer).save_verdict(consignment, status, VIOLATIONS)
+            db.close()
+            local.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(local)
+
+    workers = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    start = time.perf_counter()
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    percentiles = statistics.quantiles(latencies, n=100)
+    print(
+        f"{name:<14} {len(latencies) / elapsed:>10.1f} updates/s  "
+        f"p50={percentiles[49] * 1000:.2f}ms  p95={percentiles[94] * 1000:.2f}ms  "
+        f"p99={percentiles[98] * 1000:.2f}ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--updates", type=int, default=200, help="updates per thread")
+    parser.add_argument("--consignments", type=int, default=1000, help="at least --threads, so each thread has its own rows")
+    parser.add_argument("--interval-ms", type=float, default=5)
+    parser.add_argument("--max-batch", type=int, default=100)
+    args = parser.parse_args()
+    if args.consignments < args.threads:
+        parser.error("--consignments must be at least --threads")
+
+    init_db()
+    ids = seed_consignments(args.consignments)
+
+    run("per-request", None, ids, args.threads, args.updates)
+
+    committer = GroupCommitter(get_sessionmaker(), interval_ms=args.interval_ms, max_batch=args.max_batch)
+    try:
+        run("group-commit", committer, ids, args.threads, args.updates)
+    finally:
+        committer.close()
+
+
+if __name__ == "__main__":
+    main()
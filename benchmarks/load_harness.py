@@ -0,0 +1,356 @@
+"""
+End-to-end load harness for the compliance API.
+
+Boots the app against a local storage backend (in-memory, or a throwaway
+SQLite file), seeds rules, a reference dataset and consignments through the
+API, then drives a weighted mix of create, check, batch-check, list and report
+requests from concurrent clients. Prints throughput and p50/p95/p99 latency
+per endpoint and writes them as JSON, so runs before and after a change can
+be compared with --compare or a plain diff.
+
+By default the app is served by uvicorn on a local port; --transport asgi
+calls it in-process instead, which needs no server but shares the client's
+event loop.
+
+Usage:
+    python benchmarks/load_harness.py --concurrency 32 --requests 5000 --output benchmarks/results/before.json
+    python benchmarks/load_harness.py --backend sqlite --compare benchmarks/results/before.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from attachments import AttachmentStore
+from main import create_app
+from repository import InMemoryStorage, SQLStorage
+
+BASE_URL = "/api/v1"
+
+# Workload methods, in reporting order
+OPERATIONS = ("create", "check", "batch", "list", "report")
+DEFAULT_MIX = "create=2,check=5,batch=1,list=2,report=2"
+
+SANCTIONED_COUNTRIES = ["Iran", "North Korea", "Syria", "Cuba", "Belarus"]
+DESTINATIONS = ["Germany", "France", "USA", "Japan", "Brazil", "India", "Canada"] + SANCTIONED_COUNTRIES[:2]
+ITEM_NAMES = ["Office Supplies", "Medical Device", "Laptop", "Machine Parts", "Textiles", "Chemicals", "Drone"]
+
+RULES = [
+    {
+        "name": "Sanctioned Destinations",
+        "condition": "destination not in ref('sanctioned_countries')",
+        "description": "Shipments to sanctioned countries are not allowed",
+        "severity": "high",
+    },
+    {
+        "name": "High Value",
+        "condition": "customs_value < 50000",
+        "description": "High-value shipments require additional scrutiny",
+        "severity": "medium",
+    },
+    {
+        "name": "Clearance Required",
+        "condition": "not any(item.get('requires_clearance', False) for item in items)",
+        "description": "Items requiring clearance need special handling",
+        "severity": "high",
+    },
+    {
+        "name": "Heavy Items",
+        "condition": "all(item['weight'] <= 1000 for item in items)",
+        "description": "Items over 1000kg need a freight permit",
+        "severity": "low",
+    },
+    {
+        "name": "Declared Value Matches Items",
+        "condition": "sum(item['value'] for item in items) <= customs_value * 1.1",
+        "description": "Item values must not exceed the declared customs value",
+        "severity": "medium",
+    },
+]
+
+
+def parse_mix(mix: str) -> Dict[str, int]:
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        if name not in OPERATIONS:
+            raise ValueError(f"Unknown operation {name!r}; expected one of {', '.join(OPERATIONS)}")
+        weights[name] = int(weight or 1)
+    return weights
+
+
+def make_consignment(rng: random.Random) -> Dict[str, Any]:
+    items = [
+        {
+            "name": rng.choice(ITEM_NAMES),
+            "value": round(rng.uniform(10, 20000), 2),
+            "weight": round(rng.uniform(0.5, 1200), 1),
+            "requires_clearance": rng.random() < 0.1,
+        }
+        for _ in range(rng.randint(1, 8))
+    ]
+    return {
+        "items": items,
+        "destination": rng.choice(DESTINATIONS),
+        "customs_value": round(sum(item["value"] for item in items) * rng.uniform(0.95, 1.3), 2),
+        "attachments": ["invoice.pdf"],
+    }
+
+
+class Workload:
+    """Shared state for the client workers: known consignment ids and recorded latencies"""
+
+    def __init__(self, client: httpx.AsyncClient, rng: random.Random, batch_size: int):
+        self.client = client
+        self.rng = rng
+        self.batch_size = batch_size
+        self.consignment_ids: List[str] = []
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+
+    async def request(self, name: str, method: str, url: str, **kwargs) -> Optional[httpx.Response]:
+        start = time.perf_counter()
+        try:
+            response = await self.client.request(method, url, **kwargs)
+        except httpx.HTTPError:
+            self.errors[name] += 1
+            return None
+        self.latencies[name].append(time.perf_counter() - start)
+        if response.status_code >= 400:
+            self.errors[name] += 1
+        return response
+
+    async def create(self) -> None:
+        response = await self.request("create", "POST", f"{BASE_URL}/consignments", json=make_consignment(self.rng))
+        if response is not None and response.status_code == 200:
+            self.consignment_ids.append(response.json()["id"])
+
+    async def check(self) -> None:
+        consignment_id = self.rng.choice(self.consignment_ids)
+        await self.request("check", "POST", f"{BASE_URL}/compliance/check", json={"consignment_id": consignment_id})
+
+    async def batch(self) -> None:
+        ids = self.rng.sample(self.consignment_ids, min(self.batch_size, len(self.consignment_ids)))
+        await self.request("batch", "POST", f"{BASE_URL}/compliance/batch-check", json={"consignment_ids": ids})
+
+    async def list(self) -> None:
+        skip = self.rng.randrange(max(1, len(self.consignment_ids) - 20))
+        await self.request("list", "GET", f"{BASE_URL}/consignments", params={"skip": skip, "limit": 20})
+
+    async def report(self) -> None:
+        consignment_id = self.rng.choice(self.consignment_ids)
+        await self.request("report", "GET", f"{BASE_URL}/consignments/{consignment_id}/report")
+
+
+async def seed(client: httpx.AsyncClient, rng: random.Random, consignments: int, concurrency: int) -> List[str]:
+    """Create the rules, reference dataset and initial consignments through the API"""
+    response = await client.put(
+        f"{BASE_URL}/datasets/sanctioned_countries",
+        json={"description": "Sanctioned countries", "entries": SANCTIONED_COUNTRIES},
+    )
+    response.raise_for_status()
+    for rule in RULES:
+        response = await client.post(f"{BASE_URL}/rules", json={**rule, "status": "active"})
+        response.raise_for_status()
+
+    bodies = [make_consignment(rng) for _ in range(consignments)]
+    ids: List[str] = []
+
+    async def create_all(start: int) -> None:
+        for body in bodies[start::concurrency]:
+            response = await client.post(f"{BASE_URL}/consignments", json=body)
+            response.raise_for_status()
+            ids.append(response.json()["id"])
+
+    await asyncio.gather(*(create_all(n) for n in range(concurrency)))
+    return sorted(ids)
+
+
+def summarize(latencies: List[float], errors: int, elapsed: float) -> Dict[str, Any]:
+    latencies = sorted(latencies)
+    summary: Dict[str, Any] = {
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput_rps": round(len(latencies) / elapsed, 1) if elapsed > 0 else 0.0,
+    }
+    if len(latencies) >= 2:
+        percentiles = statistics.quantiles(latencies, n=100, method="inclusive")
+        summary.update({
+            "mean_ms": round(statistics.fmean(latencies) * 1000, 3),
+            "p50_ms": round(percentiles[49] * 1000, 3),
+            "p95_ms": round(percentiles[94] * 1000, 3),
+            "p99_ms": round(percentiles[98] * 1000, 3),
+            "max_ms": round(latencies[-1] * 1000, 3),
+        })
+    return summary
+
+
+async def drive(client: httpx.AsyncClient, args: argparse.Namespace) -> Dict[str, Any]:
+    rng = random.Random(args.seed)
+    workload = Workload(client, rng, args.batch_size)
+    workload.consignment_ids = await seed(client, rng, args.consignments, args.concurrency)
+
+    weights = parse_mix(args.mix)
+    schedule = rng.choices(list(weights), weights=list(weights.values()), k=args.requests)
+    next_index = iter(range(len(schedule)))
+
+    async def worker() -> None:
+        # Workers pull from one shared schedule, so the mix is the same at any concurrency
+        for index in next_index:
+            await getattr(workload, schedule[index])()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - start
+
+    all_latencies = [latency for latencies in workload.latencies.values() for latency in latencies]
+    return {
+        "elapsed_s": round(elapsed, 3),
+        "total": summarize(all_latencies, sum(workload.errors.values()), elapsed),
+        "endpoints": {
+            name: summarize(workload.latencies[name], workload.errors[name], elapsed)
+            for name in OPERATIONS if name in weights
+        },
+    }
+
+
+def create_storage(backend: str, workdir: str):
+    if backend == "sqlite":
+        from sqlalchemy import create_engine
+
+        engine = create_engine(f"sqlite:///{os.path.join(workdir, 'load.db')}", connect_args={"check_same_thread": False})
+        return SQLStorage(engine=engine, create_tables=True)
+    return InMemoryStorage()
+
+
+@asynccontextmanager
+async def serve(app, transport: str) -> AsyncIterator[httpx.AsyncClient]:
+    """Yield a client for `app`, served in-process over ASGI or by uvicorn on a free local port"""
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    if transport == "asgi":
+        async with app.router.lifespan_context(app):
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://harness", limits=limits) as client:
+                yield client
+        return
+
+    import uvicorn
+
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        if not thread.is_alive():
+            raise RuntimeError("uvicorn failed to start")
+        await asyncio.sleep(0.05)
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", limits=limits, timeout=60) as client:
+            yield client
+    finally:
+        server.should_exit = True
+        thread.join()
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    with tempfile.TemporaryDirectory() as workdir:
+        app = create_app(create_storage(args.backend, workdir), AttachmentStore(os.path.join(workdir, "attachments")))
+
+        async def main() -> Dict[str, Any]:
+            async with serve(app, args.transport) as client:
+                return await drive(client, args)
+
+        results = asyncio.run(main())
+
+    return {
+        "config": {
+            key: getattr(args, key)
+            for key in ("backend", "transport", "concurrency", "requests", "consignments", "batch_size", "mix", "seed")
+        },
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "commit": _git_commit(),
+        },
+        **results,
+    }
+
+
+def print_results(results: Dict[str, Any], baseline: Optional[Dict[str, Any]] = None) -> None:
+    columns = ("requests", "errors", "throughput_rps", "p50_ms", "p95_ms", "p99_ms", "max_ms")
+    print(f"{'endpoint':<10}" + "".join(f"{column:>18}" for column in columns))
+    rows = {**results["endpoints"], "total": results["total"]}
+    baseline_rows = {**baseline["endpoints"], "total": baseline["total"]} if baseline else {}
+    for name, summary in rows.items():
+        line = f"{name:<10}"
+        for column in columns:
+            value = summary.get(column, "-")
+            cell = str(value)
+            before = baseline_rows.get(name, {}).get(column)
+            if isinstance(value, (int, float)) and before:
+                cell += f" ({(value - before) / before:+.0%})"
+            line += f"{cell:>18}"
+        print(line)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backend", choices=["memory", "sqlite"], default="memory", help="storage behind the app")
+    parser.add_argument("--transport", choices=["http", "asgi"], default="http", help="uvicorn on a local port, or in-process")
+    parser.add_argument("--concurrency", type=int, default=16, help="concurrent clients")
+    parser.add_argument("--requests", type=int, default=2000, help="measured requests across all clients")
+    parser.add_argument("--consignments", type=int, default=500, help="consignments seeded before measuring")
+    parser.add_argument("--batch-size", type=int, default=20, help="consignments per batch-check")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="operation weights, e.g. 'check=5,list=1'")
+    parser.add_argument("--seed", type=int, default=1, help="random seed for data and request order")
+    parser.add_argument("--output", "-o", help="write results as JSON to this file")
+    parser.add_argument("--compare", help="results JSON of an earlier run to show relative changes against")
+    args = parser.parse_args(argv)
+
+    parse_mix(args.mix)
+    results = run(args)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+            f.write("\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,84 @@
+"""
+Measure API worker startup: the time to import `main` and to run the app's
+lifespan startup, each in a fresh interpreter, reported as medians.
+
+Framework imports (fastapi, sqlalchemy, pydantic) are timed separately since
+they are the same for any version of the app. Pass --tree to measure another
+checkout (e.g. a `git worktree` of an older commit) with the same script.
+
+Usage:
+    python benchmarks/startup_bench.py --runs 25
+    DATABASE_URL=postgresql://... python benchmarks/startup_bench.py --tree /tmp/old-checkout
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+# Runs inside the measured tree; prints one JSON line
+_PROBE = """
+import json, os, sys, time
+sys.path.insert(0, os.getcwd())
+t0 = time.perf_counter()
+import fastapi, pydantic, sqlalchemy
+t1 = time.perf_counter()
+result = {"framework_ms": (t1 - t0) * 1000}
+try:
+    import main
+except Exception as e:
+    result["error"] = type(e).__name__
+else:
+    result["import_ms"] = (time.perf_counter() - t1) * 1000
+    router = getattr(getattr(main, "app", None), "router", None)
+    if router is not None and getattr(router, "lifespan_context", None) is not None:
+        import asyncio
+
+        async def startup():
+            async with router.lifespan_context(main.app):
+                pass
+
+        t2 = time.perf_counter()
+        try:
+            asyncio.run(startup())
+            result["lifespan_ms"] = (time.perf_counter() - t2) * 1000
+        except Exception as e:
+            result["error"] = type(e).__name__
+print(json.dumps(result))
+"""
+
+
+def measure(tree: str, runs: int) -> dict:
+    samples = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for i in range(runs):
+            env = dict(os.environ)
+            # A fresh SQLite file per run unless a database is given; tables are only created
+            # at startup when DATABASE_CREATE_TABLES is set
+            env.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(workdir, f'startup-{i}.db')}")
+            completed = subprocess.run(
+                [sys.executable, "-c", _PROBE], cwd=tree, env=env, capture_output=True, text=True
+            )
+            samples.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+
+    summary = {"runs": runs, "errors": sorted({s["error"] for s in samples if "error" in s})}
+    for key in ("framework_ms", "import_ms", "lifespan_ms"):
+        values = [s[key] for s in samples if key in s]
+        if values:
+            summary[key] = round(statistics.median(values), 1)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tree", default=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                        help="checkout to measure (default: this one)")
+    parser.add_argument("--runs", type=int, default=25)
+    args = parser.parse_args()
+    print(json.dumps(measure(args.tree, args.runs), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+import threading
+from typing import Dict, List, Optional
+
+from reference_data import ReferenceSet
+from repository import Repository
+from rule_engine import ComplianceEngine, Rule
+
+
+class EngineCache:
+    """
+    Per-process cache of the active rules and reference dataset indexes used
+    to build ComplianceEngines.
+
+    Each request only reads the rule-set version and the dataset versions.
+    Rules are reloaded when the rule-set version changes, and a dataset is
+    re-indexed when its own version changes, without reloading rules.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._rule_set_version: Optional[int] = None
+        self._rules: List[Rule] = []
+        self._datasets: Dict[str, ReferenceSet] = {}
+
+    def get_engine(self, repo: Repository) -> ComplianceEngine:
+        rule_set_version = repo.get_rule_set_version()
+        dataset_versions = repo.get_dataset_versions()
+
+        with self._lock:
+            rules = self._rules if rule_set_version == self._rule_set_version else None
+            datasets = dict(self._datasets)
+
+        # Load whatever is stale outside the lock; a concurrent request may do the same, which is harmless
+        if rules is None:
+            rules = [
+                Rule(id=str(rule.id), name=rule.name or "", description=rule.description or "", condition=rule.condition)
+                for rule in repo.get_active_rules()
+            ]
+        for name in list(datasets):
+            if name not in dataset_versions:
+                del datasets[name]
+        for name, version in dataset_versions.items():
+            if name not in datasets or datasets[name].version != version:
+                dataset = repo.get_dataset(name)
+                if dataset is not None:
+                    datasets[name] = ReferenceSet(name, dataset.version, dataset.entries or [])
+
+        with self._lock:
+            self._rule_set_version = rule_set_version
+            self._rules = rules
+            self._datasets = datasets
+
+        return ComplianceEngine(rules, datasets)
@@ -0,0 +1,79 @@
+import csv
+import io
+import json
+import os
+from datetime import datetime
+from decimal import Decimal
+from enum import Enum
+from typing import Any, Dict, Iterable, Iterator
+
+# Rows fetched from the database cursor per round trip
+EXPORT_FETCH_SIZE = int(os.getenv("EXPORT_FETCH_SIZE", "1000"))
+# Rows encoded into each chunk of the response body
+EXPORT_CHUNK_ROWS = int(os.getenv("EXPORT_CHUNK_ROWS", "500"))
+
+# Columns of an exported consignment, in CSV column order
+EXPORT_FIELDS = (
+    "id", "status", "destination", "customs_value", "items", "attachments",
+    "violations", "created_at", "updated_at", "version",
+)
+# Columns holding lists, JSON-encoded in CSV cells
+JSON_FIELDS = ("items", "attachments", "violations")
+
+MEDIA_TYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson",
+}
+
+
+def _plain(value: Any) -> Any:
+    """JSON and CSV representation of a column value"""
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    if value is None or isinstance(value, (str, int, float, bool, list, dict)):
+        return value
+    return str(value)
+
+
+def _ndjson_lines(rows: Iterable[Dict[str, Any]]) -> Iterator[str]:
+    for row in rows:
+        yield json.dumps({field: _plain(row[field]) for field in EXPORT_FIELDS}, default=_plain) + "\n"
+
+
+def _csv_lines(rows: Iterable[Dict[str, Any]]) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def line(values) -> str:
+        writer.writerow(values)
+        text = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return text
+
+    yield line(EXPORT_FIELDS)
+    for row in rows:
+        yield line([
+            json.dumps(row[field] or [], default=_plain) if field in JSON_FIELDS else _plain(row[field])
+            for field in EXPORT_FIELDS
+        ])
+
+
+def encode_rows(rows: Iterable[Dict[str, Any]], format: str, chunk_rows: int = EXPORT_CHUNK_ROWS) -> Iterator[bytes]:
+    """
+    Encode exported consignment rows as CSV or NDJSON, yielding the body in
+    chunks of `chunk_rows` rows so a large export is never held in memory.
+    """
+    lines = _csv_lines(rows) if format == "csv" else _ndjson_lines(rows)
+    chunk = []
+    for text in lines:
+        chunk.append(text)
+        if len(chunk) >= chunk_rows:
+            yield "".join(chunk).encode()
+            chunk = []
+    if chunk:
+        yield "".join(chunk).encode()
@@ -0,0 +1,151 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import bindparam, update
+from sqlalchemy.orm import Session
+
+from models import Consignment
+
+# Group commit is opt-in; by default every compliance check commits on its own
+GROUP_COMMIT_ENABLED = os.getenv("GROUP_COMMIT_ENABLED", "false").lower() in ("1", "true", "yes")
+GROUP_COMMIT_INTERVAL_MS = float(os.getenv("GROUP_COMMIT_INTERVAL_MS", "5"))
+GROUP_COMMIT_MAX_BATCH = int(os.getenv("GROUP_COMMIT_MAX_BATCH", "100"))
+# Longest a request waits for its group to commit before giving up with a 503
+GROUP_COMMIT_TIMEOUT_S = float(os.getenv("GROUP_COMMIT_TIMEOUT_S", "10"))
+
+_PendingUpdate = Tuple[Any, Any, List[Dict[str, Any]], Future]
+
+# One statement executed with a parameter set per consignment
+_VERDICT_UPDATE = update(Consignment.__table__)\
+    .where(Consignment.__table__.c.id == bindparam("b_id"))\
+    .values(
+        status=bindparam("b_status"),
+        violations=bindparam("b_violations"),
+        version=Consignment.__table__.c.version + 1,
+        updated_at=bindparam("b_updated_at"),
+    )
+
+
+class GroupCommitTimeout(Exception):
+    """Raised when a verdict update is not confirmed committed within GROUP_COMMIT_TIMEOUT_S"""
+
+
+class GroupCommitter:
+    """
+    Coalesces consignment verdict updates from concurrent requests into one
+    batched UPDATE and a single commit.
+
+    A group is flushed when `interval_ms` has passed since its first update or
+    when it holds `max_batch` updates, whichever comes first. The Future
+    returned by `submit` resolves only after the group's transaction has
+    committed (or fails with the commit error), so a caller that waits on it
+    gets the same durability as calling `db.commit()` itself. Every Future is
+    resolved even if opening or closing the session fails, and such failures
+    never stop the writer thread.
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Session],
+        interval_ms: float = GROUP_COMMIT_INTERVAL_MS,
+        max_batch: int = GROUP_COMMIT_MAX_BATCH,
+    ):
+        self._session_factory = session_factory
+        self._interval = interval_ms / 1000.0
+        self._max_batch = max_batch
+        self._queue: "queue.Queue[Optional[_PendingUpdate]]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+
+    def submit(self, consignment_id: Any, status: Any, violations: List[Dict[str, Any]]) -> Future:
+        """Queue a verdict update; the returned Future resolves once it is committed"""
+        future: Future = Future()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Group committer is closed")
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="group-commit", daemon=True)
+                self._thread.start()
+            self._queue.put((consignment_id, status, violations, future))
+        return future
+
+    def close(self) -> None:
+        """Flush pending updates and stop the background writer"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            thread = self._thread
+            if thread is not None:
+                self._queue.put(None)
+        if thread is not None:
+            thread.join()
+
+    def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            entry = self._queue.get()
+            if entry is None:
+                break
+
+            # Collect further updates until the group is full or its window closes
+            batch = [entry]
+            deadline = time.monotonic() + self._interval
+            while len(batch) < self._max_batch:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    entry = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if entry is None:
+                    stopping = True
+                    break
+                batch.append(entry)
+
+            self._flush(batch)
+
+    def _flush(self, batch: List[_PendingUpdate]) -> None:
+        try:
+            self._commit(batch)
+        except Exception as e:
+            error: Optional[Exception] = e
+        else:
+            error = None
+        for *_, future in batch:
+            # A caller may have cancelled its Future; resolving it again would raise here
+            if not future.set_running_or_notify_cancel():
+                continue
+            if error is None:
+                future.set_result(None)
+            else:
+                future.set_exception(error)
+
+    def _commit(self, batch: List[_PendingUpdate]) -> None:
+        # Later updates to the same consignment win, as they would with per-request commits
+        now = datetime.utcnow()
+        rows: Dict[Any, Dict[str, Any]] = {}
+        for consignment_id, status, violations, _ in batch:
+            rows[consignment_id] = {
+                "b_id": consignment_id,
+                "b_status": status,
+                "b_violations": violations,
+                "b_updated_at": now,
+            }
+
+        session = self._session_factory()
+        try:
+            session.execute(_VERDICT_UPDATE, list(rows.values()))
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
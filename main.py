@@ -1,79 +1,139 @@
-from fastapi import FastAPI, Depends, HTTPException, status, Query
-from sqlalchemy.orm import Session
-from typing import List, Optional
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from fastapi import FastAPI, APIRouter, Depends, HTTPException, Request, Response, status, Query, Path
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import UploadFile
+from typing import AsyncIterator, List, Optional
+import mimetypes
+import os
+import secrets
 import uuid
 
-from database import get_db, engine, Base
-from models import Consignment, Rule
+from repository import Repository, Storage, SQLStorage, InMemoryStorage
 from schemas import (
     ConsignmentCreate, ConsignmentResponse, RuleCreate, RuleResponse,
     ComplianceCheck, ComplianceResponse, ConsignmentStatus, BatchComplianceCheck, BatchComplianceResponse,
-    PaginatedConsignmentResponse
+    PaginatedConsignmentResponse, Attachment,
+    ReferenceDatasetCreate, ReferenceDatasetSummary, ReferenceDatasetResponse
 )
-from rule_engine import ComplianceEngine
+from rule_engine import RuleEvaluator, compute_item_aggregates, RULE_COST_WARN, RULE_MAX_ESTIMATED_COST
+from engine_cache import EngineCache
+from attachments import AttachmentStore, AttachmentTooLarge
+from admission import AdmissionController, admit, create_admission_controller
+from tracing import ProfilerBusy, RequestTrace
+from group_commit import GroupCommitTimeout
+from export import MEDIA_TYPES, encode_rows
 
-# Create database tables
-Base.metadata.create_all(bind=engine)
+# Storage backend used by the default app: "sql" (DATABASE_URL) or "memory"
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "sql")
 
-app = FastAPI(title="Compliance Verification System")
+# Token for admin-only request options such as compliance check tracing; unset disables them
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
+router = APIRouter()
+
+# Dependency to get a repository from the app's storage backend
+def get_repository(request: Request):
+    yield from request.app.state.storage.repository()
+
+def _etag(kind: str, version: int) -> str:
+    return f'"{kind}-{version}"'
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    """Whether the request's If-None-Match header matches `etag`"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    candidates = [value.strip().removeprefix("W/") for value in header.split(",")]
+    return "*" in candidates or etag in candidates
 
 # Consignment endpoints
-@app.post("/api/v1/consignments", response_model=ConsignmentResponse)
-def create_consignment(consignment: ConsignmentCreate, db: Session = Depends(get_db)):
-    db_consignment = Consignment(
-        status=ConsignmentStatus.PENDING,
-        items=consignment.dict()["items"],
-        destination=consignment.destination,
-        customs_value=consignment.customs_value,
-        attachments=consignment.attachments,
-        violations=[]
+@router.post("/api/v1/consignments", response_model=ConsignmentResponse)
+def create_consignment(consignment: ConsignmentCreate, repo: Repository = Depends(get_repository)):
+    items = consignment.dict()["items"]
+    return repo.create_consignment({
+        "items": items,
+        "item_aggregates": compute_item_aggregates(items),
+        "destination": consignment.destination,
+        "customs_value": consignment.customs_value,
+        "attachments": consignment.attachments,
+    })
+
+def _naive_utc(value: Optional[datetime]) -> Optional[datetime]:
+    """Timestamps are stored as naive UTC; convert aware query values to match"""
+    if value is None or value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+@router.get("/api/v1/consignments/export")
+def export_consignments(
+    format: str = Query(default="ndjson", pattern="^(csv|ndjson)$"),
+    status: Optional[ConsignmentStatus] = None,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    repo: Repository = Depends(get_repository)
+):
+    """
+    Stream all matching consignments with their status and violations as CSV
+    or NDJSON, oldest first. `created_from` is inclusive, `created_to` exclusive.
+    """
+    rows = repo.export_consignments(status, _naive_utc(created_from), _naive_utc(created_to))
+    filename = f"consignments-{datetime.utcnow():%Y%m%dT%H%M%S}.{format}"
+    return StreamingResponse(
+        encode_rows(rows, format),
+        media_type=MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
     )
-    db.add(db_consignment)
-    db.commit()
-    db.refresh(db_consignment)
-    return db_consignment
 
-@app.get("/api/v1/consignments/{consignment_id}", response_model=ConsignmentResponse)
-def get_consignment(consignment_id: uuid.UUID, db: Session = Depends(get_db)):
-    db_consignment = db.query(Consignment).filter(Consignment.id == consignment_id).first()
+@router.get("/api/v1/consignments/{consignment_id}", response_model=ConsignmentResponse)
+def get_consignment(
+    consignment_id: uuid.UUID,
+    request: Request,
+    response: Response,
+    repo: Repository = Depends(get_repository)
+):
+    # Answer conditional requests from the version alone, without loading the row
+    if request.headers.get("if-none-match"):
+        version = repo.get_consignment_version(consignment_id)
+        if version is None:
+            raise HTTPException(status_code=404, detail="Consignment not found")
+        etag = _etag("consignment", version)
+        if _etag_matches(request, etag):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+
+    db_consignment = repo.get_consignment(consignment_id)
     if not db_consignment:
         raise HTTPException(status_code=404, detail="Consignment not found")
+    response.headers["ETag"] = _etag("consignment", db_consignment.version)
     return db_consignment
 
-@app.put("/api/v1/consignments/{consignment_id}", response_model=ConsignmentResponse)
+@router.put("/api/v1/consignments/{consignment_id}", response_model=ConsignmentResponse)
 def update_consignment(
     consignment_id: uuid.UUID,
     consignment: ConsignmentCreate,
-    db: Session = Depends(get_db)
+    repo: Repository = Depends(get_repository)
 ):
-    db_consignment = db.query(Consignment).filter(Consignment.id == consignment_id).first()
+    db_consignment = repo.get_consignment(consignment_id)
     if not db_consignment:
         raise HTTPException(status_code=404, detail="Consignment not found")
-    
+
     update_data = consignment.dict(exclude_unset=True)
-    for field, value in update_data.items():
-        setattr(db_consignment, field, value)
-    
-    db_consignment.status = ConsignmentStatus.PENDING
-    db_consignment.violations = []
-    
-    db.commit()
-    db.refresh(db_consignment)
-    return db_consignment
+    if "items" in update_data:
+        update_data["item_aggregates"] = compute_item_aggregates(update_data["items"])
+    update_data["status"] = ConsignmentStatus.PENDING
+    update_data["violations"] = []
 
-@app.get("/api/v1/consignments", response_model=PaginatedConsignmentResponse)
+    return repo.update_consignment(db_consignment, update_data)
+
+@router.get("/api/v1/consignments", response_model=PaginatedConsignmentResponse)
 def list_consignments(
     skip: int = Query(default=0, ge=0),
     limit: int = Query(default=10, ge=1, le=100),
-    db: Session = Depends(get_db)
+    repo: Repository = Depends(get_repository)
 ):
-    total = db.query(Consignment).count()
-    consignments = db.query(Consignment)\
-        .order_by(Consignment.created_at.desc())\
-        .offset(skip)\
-        .limit(limit)\
-        .all()
-    
+    consignments, total = repo.list_consignments(skip, limit)
+
     return {
         "consignments": consignments,
         "total": total,
@@ -82,56 +142,104 @@ def list_consignments(
     }
 
 # Rule endpoints
-@app.post("/api/v1/rules", response_model=RuleResponse)
-def create_rule(rule: RuleCreate, db: Session = Depends(get_db)):
-    db_rule = Rule(**rule.dict())
-    db.add(db_rule)
-    db.commit()
-    db.refresh(db_rule)
-    return db_rule
-
-@app.get("/api/v1/rules", response_model=List[RuleResponse])
-def get_rules(db: Session = Depends(get_db)):
-    return db.query(Rule).filter(Rule.status == 'active').all()
+def _check_rule_cost(condition: str, response: Response) -> None:
+    """Reject rules whose estimated evaluation cost is over the limit, and warn about expensive ones"""
+    try:
+        cost = RuleEvaluator.estimate_cost(condition)
+    except SyntaxError as e:
+        raise HTTPException(status_code=422, detail=f"Invalid rule condition: {e.msg}")
+    if RULE_MAX_ESTIMATED_COST and cost > RULE_MAX_ESTIMATED_COST:
+        raise HTTPException(
+            status_code=422,
+            detail=f"Rule is too expensive to evaluate (estimated cost {cost}, limit {RULE_MAX_ESTIMATED_COST})"
+        )
+    response.headers["X-Rule-Estimated-Cost"] = str(cost)
+    if RULE_COST_WARN and cost > RULE_COST_WARN:
+        response.headers["Warning"] = f'199 - "Estimated rule cost {cost} exceeds {RULE_COST_WARN}"'
+
+@router.post("/api/v1/rules", response_model=RuleResponse)
+def create_rule(rule: RuleCreate, response: Response, repo: Repository = Depends(get_repository)):
+    _check_rule_cost(rule.condition, response)
+    return repo.create_rule(rule.dict())
+
+@router.get("/api/v1/rules", response_model=List[RuleResponse])
+def get_rules(request: Request, response: Response, repo: Repository = Depends(get_repository)):
+    # Read the version before the rules so a concurrent change can only make the ETag stale, never too new
+    etag = _etag("rules", repo.get_rule_set_version())
+    if _etag_matches(request, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+    return repo.get_active_rules()
 
 # Compliance check endpoint
-@app.post("/api/v1/compliance/check", response_model=ComplianceResponse)
-def check_compliance(check: ComplianceCheck, db: Session = Depends(get_db)):
-    # Get consignment
-    consignment = db.query(Consignment).filter(Consignment.id == check.consignment_id).first()
-    if not consignment:
-        raise HTTPException(status_code=404, detail="Consignment not found")
+def _require_admin(request: Request) -> None:
+    """Only callers presenting ADMIN_TOKEN in X-Admin-Token may use admin-only options"""
+    token = request.headers.get("x-admin-token", "")
+    if not ADMIN_TOKEN or not secrets.compare_digest(token, ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Admin token required")
 
-    # Get active rules
-    active_rules = db.query(Rule).filter(Rule.status == 'active').all()
-    
-    # Create compliance engine and check rules
-    engine = ComplianceEngine(active_rules)
-    
-    # Prepare consignment data for rule evaluation
-    consignment_data = {
-        "destination": consignment.destination,
-        "customs_value": float(consignment.customs_value),
-        "items": consignment.items,
-    }
-    
-    # Check compliance
-    status, violations = engine.check_compliance(consignment_data)
-    
-    # Update consignment with results
-    consignment.status = status
-    consignment.violations = [violation.dict() for violation in violations]
-    db.commit()
-    
-    return ComplianceResponse(status=status, violations=violations)
+def _profiler_busy(request: Request, exc: ProfilerBusy) -> JSONResponse:
+    """Profiled requests are serialized; a second concurrent one is turned away rather than failed"""
+    return JSONResponse(status_code=409, content={"detail": f"{exc}, retry later"}, headers={"Retry-After": "1"})
+
+def _group_commit_timeout(request: Request, exc: GroupCommitTimeout) -> JSONResponse:
+    """The database is not keeping up; the verdict may still be written, so the check is safe to retry"""
+    return JSONResponse(status_code=503, content={"detail": f"{exc}, retry later"}, headers={"Retry-After": "1"})
+
+@router.post(
+    "/api/v1/compliance/check",
+    response_model=ComplianceResponse,
+    response_model_exclude_none=True,
+    dependencies=[Depends(admit("single"))]
+)
+def check_compliance(
+    check: ComplianceCheck,
+    request: Request,
+    trace: bool = Query(default=False, description="Include a timing breakdown (admin only)"),
+    profile: bool = Query(default=False, description="Capture a cProfile dump of the request (admin only)"),
+    repo: Repository = Depends(get_repository)
+):
+    if trace or profile:
+        _require_admin(request)
+    request_trace = RequestTrace(enabled=trace, profile=profile)
+
+    with request_trace.profiled(f"check-{check.consignment_id}"), request_trace.span("total"):
+        # Get consignment
+        with request_trace.span("db_fetch"):
+            consignment = repo.get_consignment(check.consignment_id)
+        if not consignment:
+            raise HTTPException(status_code=404, detail="Consignment not found")
+
+        # Get the compliance engine for the current rules and reference datasets
+        with request_trace.span("rule_load"):
+            engine = request.app.state.engine_cache.get_engine(repo)
+
+        # Prepare consignment data for rule evaluation
+        consignment_data = {
+            "destination": consignment.destination,
+            "customs_value": float(consignment.customs_value),
+            "items": consignment.items,
+            "item_aggregates": consignment.item_aggregates,
+        }
+
+        # Check compliance
+        with request_trace.span("evaluation"):
+            status, violations = engine.check_compliance(consignment_data, trace=request_trace.rules)
+
+        # Update consignment with results; an undecided verdict (budget overruns only) is saved as
+        # pending with its errors so a previous verdict does not stand for changed data or rules
+        with request_trace.span("db_save"):
+            repo.save_verdict(consignment, status, [violation.dict() for violation in violations])
+
+    return ComplianceResponse(status=status, violations=violations, trace=request_trace.report())
 
 # Report endpoint
-@app.get("/api/v1/consignments/{consignment_id}/report")
-def generate_report(consignment_id: uuid.UUID, db: Session = Depends(get_db)):
-    consignment = db.query(Consignment).filter(Consignment.id == consignment_id).first()
+@router.get("/api/v1/consignments/{consignment_id}/report")
+def generate_report(consignment_id: uuid.UUID, repo: Repository = Depends(get_repository)):
+    consignment = repo.get_consignment(consignment_id)
     if not consignment:
         raise HTTPException(status_code=404, detail="Consignment not found")
-    
+
     # For v1, return a simple JSON report
     return {
         "consignment_id": str(consignment.id),
@@ -143,92 +251,253 @@ def generate_report(consignment_id: uuid.UUID, db: Session = Depends(get_db)):
     }
 
 # Rule modification and deletion
-@app.delete("/api/v1/rules/{rule_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_rule(rule_id: uuid.UUID, db: Session = Depends(get_db)):
+@router.delete("/api/v1/rules/{rule_id}", status_code=status.HTTP_204_NO_CONTENT)
+def delete_rule(rule_id: uuid.UUID, repo: Repository = Depends(get_repository)):
     """Delete a specific rule"""
-    rule = db.query(Rule).filter(Rule.id == rule_id).first()
+    rule = repo.get_rule(rule_id)
     if not rule:
         raise HTTPException(status_code=404, detail="Rule not found")
-    
-    db.delete(rule)
-    db.commit()
+
+    repo.delete_rule(rule)
     return {"message": "Rule deleted successfully"}
 
-@app.put("/api/v1/rules/{rule_id}", response_model=RuleResponse)
-def update_rule(rule_id: uuid.UUID, rule: RuleCreate, db: Session = Depends(get_db)):
+@router.put("/api/v1/rules/{rule_id}", response_model=RuleResponse)
+def update_rule(rule_id: uuid.UUID, rule: RuleCreate, response: Response, repo: Repository = Depends(get_repository)):
     """Update an existing rule"""
-    db_rule = db.query(Rule).filter(Rule.id == rule_id).first()
+    db_rule = repo.get_rule(rule_id)
     if not db_rule:
         raise HTTPException(status_code=404, detail="Rule not found")
-    
+
+    _check_rule_cost(rule.condition, response)
+
     # Update rule fields
-    for field, value in rule.dict().items():
-        setattr(db_rule, field, value)
-    
-    db.commit()
-    db.refresh(db_rule)
-    return db_rule
+    return repo.update_rule(db_rule, rule.dict())
 
 # Consignment deletion
-@app.delete("/api/v1/consignments/{consignment_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_consignment(consignment_id: uuid.UUID, db: Session = Depends(get_db)):
+@router.delete("/api/v1/consignments/{consignment_id}", status_code=status.HTTP_204_NO_CONTENT)
+def delete_consignment(consignment_id: uuid.UUID, repo: Repository = Depends(get_repository)):
     """Delete a specific consignment"""
-    consignment = db.query(Consignment).filter(Consignment.id == consignment_id).first()
+    consignment = repo.get_consignment(consignment_id)
     if not consignment:
         raise HTTPException(status_code=404, detail="Consignment not found")
-    
-    db.delete(consignment)
-    db.commit()
+
+    repo.delete_consignment(consignment)
     return {"message": "Consignment deleted successfully"}
 
 
-@app.post("/api/v1/compliance/batch-check", response_model=BatchComplianceResponse)
-def batch_check_compliance(check: BatchComplianceCheck, db: Session = Depends(get_db)):
+# Attachment endpoints
+async def _read_upload(upload: UploadFile, chunk_size: int = 64 * 1024) -> AsyncIterator[bytes]:
+    while chunk := await upload.read(chunk_size):
+        yield chunk
+
+@router.post("/api/v1/consignments/{consignment_id}/attachments", response_model=Attachment)
+async def upload_attachment(
+    consignment_id: uuid.UUID,
+    request: Request,
+    filename: Optional[str] = Query(default=None),
+    repo: Repository = Depends(get_repository)
+):
+    """
+    Upload an attachment for a consignment.
+
+    Accepts either a raw request body (with `filename` as a query parameter) or
+    a multipart form with a `file` field. Raw bodies are streamed straight to
+    storage; multipart uploads are spooled by the form parser first.
+    """
+    store: AttachmentStore = request.app.state.attachments
+    content_type = request.headers.get("content-type", "")
+
+    # Reject unknown consignments before anything is written to storage
+    if await run_in_threadpool(repo.get_consignment_version, consignment_id) is None:
+        raise HTTPException(status_code=404, detail="Consignment not found")
+
+    if content_type.startswith("multipart/form-data"):
+        form = await request.form()
+        upload = form.get("file")
+        if not isinstance(upload, UploadFile):
+            raise HTTPException(status_code=422, detail="Multipart upload requires a 'file' field")
+        filename = filename or upload.filename
+        content_type = upload.content_type or ""
+        chunks = _read_upload(upload)
+    else:
+        chunks = request.stream()
+
+    if not filename:
+        raise HTTPException(status_code=422, detail="Attachment filename is required")
+    if not content_type or content_type == "application/octet-stream":
+        content_type = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+
+    # Don't hold a database connection while the upload streams in
+    await run_in_threadpool(repo.release)
+    try:
+        sha256, size = await store.save(chunks)
+    except AttachmentTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+
+    consignment = await run_in_threadpool(repo.get_consignment, consignment_id)
+    if not consignment:
+        raise HTTPException(status_code=404, detail="Consignment not found")
+
+    attachment = {
+        "filename": os.path.basename(filename),
+        "sha256": sha256,
+        "size": size,
+        "content_type": content_type,
+        "uploaded_at": datetime.utcnow().isoformat(),
+    }
+    await run_in_threadpool(repo.add_attachment, consignment, attachment)
+    return attachment
+
+@router.get("/api/v1/consignments/{consignment_id}/attachments/{sha256}")
+def download_attachment(
+    consignment_id: uuid.UUID,
+    request: Request,
+    sha256: str = Path(pattern="^[0-9a-f]{64}$"),
+    repo: Repository = Depends(get_repository)
+):
+    """Download an attachment; supports Range requests"""
+    consignment = repo.get_consignment(consignment_id)
+    if not consignment:
+        raise HTTPException(status_code=404, detail="Consignment not found")
+
+    attachment = next((a for a in consignment.attachment_files or [] if a["sha256"] == sha256), None)
+    if not attachment:
+        raise HTTPException(status_code=404, detail="Attachment not found")
+
+    store: AttachmentStore = request.app.state.attachments
+    return FileResponse(store.path(sha256), media_type=attachment["content_type"], filename=attachment["filename"])
+
+
+@router.post(
+    "/api/v1/compliance/batch-check",
+    response_model=BatchComplianceResponse,
+    response_model_exclude_none=True,
+    dependencies=[Depends(admit("batch"))]
+)
+def batch_check_compliance(check: BatchComplianceCheck, request: Request, repo: Repository = Depends(get_repository)):
     """Check compliance for multiple consignments"""
-    # Get active rules once for all checks
-    active_rules = db.query(Rule).filter(Rule.status == 'active').all()
-    engine = ComplianceEngine(active_rules)
-    
+    # Get the compliance engine once for all checks
+    engine = request.app.state.engine_cache.get_engine(repo)
+
     results = []
+    verdicts = []
     verified_count = 0
     flagged_count = 0
-    
+
     for consignment_id in check.consignment_ids:
         # Get consignment
-        consignment = db.query(Consignment).filter(Consignment.id == consignment_id).first()
+        consignment = repo.get_consignment(consignment_id)
         if not consignment:
             continue  # Skip if consignment not found
-        
+
         # Prepare consignment data
         consignment_data = {
             "destination": consignment.destination,
             "customs_value": float(consignment.customs_value),
             "items": consignment.items,
+            "item_aggregates": consignment.item_aggregates,
         }
-        
+
         # Check compliance
         status, violations = engine.check_compliance(consignment_data)
-        
-        # Update consignment with results
-        consignment.status = status
-        consignment.violations = [violation.dict() for violation in violations]
-        
+        verdicts.append((consignment, status, [violation.dict() for violation in violations]))
+
         # Count results
         if status == ConsignmentStatus.VERIFIED:
             verified_count += 1
-        else:
+        elif status == ConsignmentStatus.FLAGGED:
             flagged_count += 1
-        
+
         results.append(ComplianceResponse(status=status, violations=violations))
-    
-    # Commit all changes
-    db.commit()
-    
+
+    # Save all results at once
+    repo.save_verdicts(verdicts)
+
     # Prepare summary
     summary = {
         "total_processed": len(results),
         "verified_count": verified_count,
         "flagged_count": flagged_count,
     }
-    
-    return BatchComplianceResponse(results=results, summary=summary) 
\ No newline at end of file
+
+    return BatchComplianceResponse(results=results, summary=summary)
+
+
+# Reference dataset endpoints
+DATASET_NAME_PATTERN = "^[A-Za-z0-9_-]{1,100}$"
+
+@router.get("/api/v1/datasets", response_model=List[ReferenceDatasetSummary])
+def list_datasets(repo: Repository = Depends(get_repository)):
+    """List reference datasets without their entries"""
+    return repo.list_datasets()
+
+@router.get("/api/v1/datasets/{name}", response_model=ReferenceDatasetResponse)
+def get_dataset(name: str = Path(pattern=DATASET_NAME_PATTERN), repo: Repository = Depends(get_repository)):
+    dataset = repo.get_dataset(name)
+    if not dataset:
+        raise HTTPException(status_code=404, detail="Reference dataset not found")
+    return dataset
+
+@router.put("/api/v1/datasets/{name}", response_model=ReferenceDatasetSummary)
+def save_dataset(
+    dataset: ReferenceDatasetCreate,
+    name: str = Path(pattern=DATASET_NAME_PATTERN),
+    repo: Repository = Depends(get_repository)
+):
+    """Create or replace a reference dataset; rules see the new version on their next evaluation"""
+    return repo.save_dataset(name, dataset.description, dataset.entries)
+
+@router.delete("/api/v1/datasets/{name}", status_code=status.HTTP_204_NO_CONTENT)
+def delete_dataset(name: str = Path(pattern=DATASET_NAME_PATTERN), repo: Repository = Depends(get_repository)):
+    dataset = repo.get_dataset(name)
+    if not dataset:
+        raise HTTPException(status_code=404, detail="Reference dataset not found")
+
+    repo.delete_dataset(dataset)
+    return {"message": "Reference dataset deleted successfully"}
+
+
+@router.get("/api/v1/compliance/admission")
+def admission_stats(request: Request):
+    """Queue depth and rejection counters for compliance admission control"""
+    controller: Optional[AdmissionController] = request.app.state.admission
+    if controller is None:
+        return {"enabled": False}
+    return {"enabled": True, "max_concurrent": controller.max_concurrent, **controller.stats()}
+
+
+def create_app(
+    storage: Optional[Storage] = None,
+    attachment_store: Optional[AttachmentStore] = None,
+    admission: Optional[AdmissionController] = None,
+) -> FastAPI:
+    """
+    Build the API application.
+
+    No storage work happens here: the backend is opened (engine creation,
+    table creation) by the lifespan when the server starts, and closed on
+    shutdown.
+    """
+    if storage is None:
+        storage = InMemoryStorage() if STORAGE_BACKEND == "memory" else SQLStorage()
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        storage.open()
+        try:
+            yield
+        finally:
+            storage.close()
+
+    app = FastAPI(title="Compliance Verification System", lifespan=lifespan)
+    app.state.storage = storage
+    app.add_exception_handler(ProfilerBusy, _profiler_busy)
+    app.add_exception_handler(GroupCommitTimeout, _group_commit_timeout)
+    app.state.attachments = attachment_store or AttachmentStore()
+    app.state.admission = admission or create_admission_controller()
+    app.state.engine_cache = EngineCache()
+    app.include_router(router)
+    return app
+
+
+app = create_app()
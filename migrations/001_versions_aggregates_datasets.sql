@@ -0,0 +1,47 @@
+-- Brings a database created from the original schema up to date.
+-- create_all only creates missing tables; it never adds columns to existing ones.
+--
+--   psql "$DATABASE_URL" -f migrations/001_versions_aggregates_datasets.sql
+--
+-- Safe to run more than once. Adding a column with a constant default does not
+-- rewrite the table on PostgreSQL 11+; existing rows read the default.
+
+BEGIN;
+
+ALTER TABLE consignments
+    ADD COLUMN IF NOT EXISTS attachment_files JSON DEFAULT '[]',
+    ADD COLUMN IF NOT EXISTS item_aggregates JSON,
+    ADD COLUMN IF NOT EXISTS version INTEGER NOT NULL DEFAULT 1,
+    ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP WITHOUT TIME ZONE;
+
+-- item_aggregates stays NULL for existing rows; checks compute them on the fly
+UPDATE consignments SET updated_at = created_at WHERE updated_at IS NULL;
+
+ALTER TABLE rules
+    ADD COLUMN IF NOT EXISTS version INTEGER NOT NULL DEFAULT 1,
+    ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP WITHOUT TIME ZONE;
+
+UPDATE rules SET updated_at = now() AT TIME ZONE 'utc' WHERE updated_at IS NULL;
+
+CREATE TABLE IF NOT EXISTS rule_set_version (
+    id SERIAL NOT NULL,
+    version INTEGER DEFAULT 0 NOT NULL,
+    PRIMARY KEY (id)
+);
+
+-- The single counter row; rule writes only ever update it
+INSERT INTO rule_set_version (id, version) VALUES (1, 0) ON CONFLICT DO NOTHING;
+
+CREATE TABLE IF NOT EXISTS reference_datasets (
+    id UUID NOT NULL,
+    name VARCHAR(100) NOT NULL,
+    description VARCHAR,
+    entries JSON,
+    size INTEGER,
+    version INTEGER DEFAULT 1 NOT NULL,
+    updated_at TIMESTAMP WITHOUT TIME ZONE,
+    PRIMARY KEY (id),
+    UNIQUE (name)
+);
+
+COMMIT;
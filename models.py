@@ -1,5 +1,6 @@
-from sqlalchemy import Column, String, JSON, Numeric, DateTime, Enum as SQLEnum
+from sqlalchemy import Column, Integer, String, JSON, Numeric, DateTime, Enum as SQLEnum, text
 from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.orm import deferred
 import uuid
 from datetime import datetime
 from database import Base
@@ -14,7 +15,12 @@ class Consignment(Base):
     customs_value = Column(Numeric)
     violations = Column(JSON)
     attachments = Column(JSON)
+    attachment_files = Column(JSON, default=list, server_default=text("'[]'"))
+    item_aggregates = Column(JSON)
     created_at = Column(DateTime, default=datetime.utcnow)
+    # Bumped by every write; used for ETags. Server defaults let existing rows backfill (see migrations/)
+    version = Column(Integer, nullable=False, default=1, server_default=text("1"))
+    updated_at = Column(DateTime, default=datetime.utcnow)
 
 class Rule(Base):
     __tablename__ = "rules"
@@ -24,4 +30,25 @@ class Rule(Base):
     condition = Column(String)
     description = Column(String)
     status = Column(SQLEnum('active', 'inactive', name='rule_status_enum'))
-    severity = Column(SQLEnum('high', 'medium', 'low', name='severity_enum')) 
\ No newline at end of file
+    severity = Column(SQLEnum('high', 'medium', 'low', name='severity_enum'))
+    version = Column(Integer, nullable=False, default=1, server_default=text("1"))
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+class RuleSetVersion(Base):
+    """Single-row counter bumped whenever any rule is created, updated or deleted"""
+    __tablename__ = "rule_set_version"
+
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False, default=0, server_default=text("0"))
+
+class ReferenceDataset(Base):
+    """Named list of values (e.g. sanctioned countries) that rules look up with ref(name)"""
+    __tablename__ = "reference_datasets"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    name = Column(String(100), unique=True, nullable=False)
+    description = Column(String)
+    entries = deferred(Column(JSON))
+    size = Column(Integer)
+    version = Column(Integer, nullable=False, default=1, server_default=text("1"))
+    updated_at = Column(DateTime, default=datetime.utcnow)
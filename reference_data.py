@@ -0,0 +1,45 @@
+import unicodedata
+from typing import Any, Iterable, Iterator
+
+
+def normalize(value: str) -> str:
+    """Canonical form for fuzzy lookups: NFKC, case-folded, punctuation dropped, whitespace collapsed"""
+    value = unicodedata.normalize("NFKC", value).casefold()
+    value = "".join(ch if ch.isalnum() else " " for ch in value)
+    return " ".join(value.split())
+
+
+class ReferenceSet:
+    """
+    In-memory index of a named reference dataset (e.g. sanctioned countries or
+    denied parties), built once per dataset version.
+
+    Membership is answered from hashed sets: a value matches if it equals an
+    entry exactly or if its normalized form matches a normalized entry, so
+    `'north  korea' in ref('sanctioned_countries')` matches "North Korea".
+    """
+
+    __slots__ = ("name", "version", "values", "normalized")
+
+    def __init__(self, name: str, version: int, entries: Iterable[str]):
+        self.name = name
+        self.version = version
+        self.values = frozenset(entries)
+        self.normalized = frozenset(normalize(entry) for entry in self.values if isinstance(entry, str))
+
+    def __contains__(self, value: Any) -> bool:
+        try:
+            if value in self.values:
+                return True
+        except TypeError:
+            return False
+        return isinstance(value, str) and normalize(value) in self.normalized
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.values)
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def __repr__(self) -> str:
+        return f"ref({self.name!r})"
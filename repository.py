@@ -0,0 +1,452 @@
+import threading
+import uuid
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Protocol, Tuple
+
+from sqlalchemy import select, update
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session, sessionmaker
+
+from database import DATABASE_CREATE_TABLES, create_schema, get_engine
+from models import Consignment, Rule, RuleSetVersion, ReferenceDataset
+from schemas import ConsignmentStatus
+from group_commit import GroupCommitter, GroupCommitTimeout, GROUP_COMMIT_ENABLED, GROUP_COMMIT_TIMEOUT_S
+from export import EXPORT_FIELDS, EXPORT_FETCH_SIZE
+
+Verdict = Tuple[Consignment, ConsignmentStatus, List[Dict[str, Any]]]
+
+
+class Repository(Protocol):
+    """Data access used by the API endpoints, independent of the storage backend"""
+
+    def create_consignment(self, data: Dict[str, Any]) -> Consignment: ...
+    def get_consignment(self, consignment_id: uuid.UUID) -> Optional[Consignment]: ...
+    def get_consignment_version(self, consignment_id: uuid.UUID) -> Optional[int]: ...
+    def update_consignment(self, consignment: Consignment, data: Dict[str, Any]) -> Consignment: ...
+    def list_consignments(self, skip: int, limit: int) -> Tuple[List[Consignment], int]: ...
+    def delete_consignment(self, consignment: Consignment) -> None: ...
+    def release(self) -> None: ...
+    def export_consignments(
+        self, status: Optional[ConsignmentStatus], created_from: Optional[datetime], created_to: Optional[datetime]
+    ) -> Iterator[Dict[str, Any]]: ...
+    def add_attachment(self, consignment: Consignment, attachment: Dict[str, Any]) -> None: ...
+    def save_verdict(self, consignment: Consignment, status: ConsignmentStatus, violations: List[Dict[str, Any]]) -> None: ...
+    def save_verdicts(self, verdicts: List[Verdict]) -> None: ...
+    def create_rule(self, data: Dict[str, Any]) -> Rule: ...
+    def get_rule(self, rule_id: uuid.UUID) -> Optional[Rule]: ...
+    def get_active_rules(self) -> List[Rule]: ...
+    def get_rule_set_version(self) -> int: ...
+    def update_rule(self, rule: Rule, data: Dict[str, Any]) -> Rule: ...
+    def delete_rule(self, rule: Rule) -> None: ...
+    def list_datasets(self) -> List[ReferenceDataset]: ...
+    def get_dataset(self, name: str) -> Optional[ReferenceDataset]: ...
+    def get_dataset_versions(self) -> Dict[str, int]: ...
+    def save_dataset(self, name: str, description: str, entries: List[str]) -> ReferenceDataset: ...
+    def delete_dataset(self, dataset: ReferenceDataset) -> None: ...
+
+
+class Storage(Protocol):
+    """A storage backend; opened and closed by the app lifespan"""
+
+    def open(self) -> None: ...
+    def close(self) -> None: ...
+    def repository(self) -> Iterator[Repository]: ...
+
+
+def _with_attachment(attachments: Optional[List[Dict[str, Any]]], attachment: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Return a new attachment list with `attachment` replacing any entry with the same content"""
+    others = [existing for existing in attachments or [] if existing["sha256"] != attachment["sha256"]]
+    return others + [attachment]
+
+
+def _export_filter(
+    consignment: Consignment, status: Optional[ConsignmentStatus], created_from: Optional[datetime], created_to: Optional[datetime]
+) -> bool:
+    """In-memory equivalent of the SQL export filters; `created_to` is exclusive"""
+    return (status is None or consignment.status == status)\
+        and (created_from is None or consignment.created_at >= created_from)\
+        and (created_to is None or consignment.created_at < created_to)
+
+
+def _stream_rows(engine: Engine, query: Any) -> Iterator[Dict[str, Any]]:
+    """
+    Yield the rows of `query` from a server-side cursor on a connection of its
+    own, so the stream outlives the request's session. A single SELECT reads
+    one snapshot for its whole lifetime, however long the client takes.
+    """
+    with engine.connect() as connection:
+        result = connection.execution_options(yield_per=EXPORT_FETCH_SIZE).execute(query)
+        for row in result.mappings():
+            yield dict(row)
+
+
+def _touch(record: Any) -> None:
+    """Bump a consignment's or rule's version for an in-place update"""
+    record.version = (record.version or 0) + 1
+    record.updated_at = datetime.utcnow()
+
+
+# SQLAlchemy backend
+
+class SQLRepository:
+    """Repository backed by a SQLAlchemy session"""
+
+    def __init__(self, db: Session, group_committer: Optional[GroupCommitter] = None):
+        self.db = db
+        self.group_committer = group_committer
+
+    def create_consignment(self, data: Dict[str, Any]) -> Consignment:
+        db_consignment = Consignment(status=ConsignmentStatus.PENDING, violations=[], attachment_files=[], **data)
+        self.db.add(db_consignment)
+        self.db.commit()
+        self.db.refresh(db_consignment)
+        return db_consignment
+
+    def get_consignment(self, consignment_id: uuid.UUID) -> Optional[Consignment]:
+        return self.db.query(Consignment).filter(Consignment.id == consignment_id).first()
+
+    def get_consignment_version(self, consignment_id: uuid.UUID) -> Optional[int]:
+        return self.db.execute(select(Consignment.version).where(Consignment.id == consignment_id)).scalar()
+
+    def update_consignment(self, consignment: Consignment, data: Dict[str, Any]) -> Consignment:
+        for field, value in data.items():
+            setattr(consignment, field, value)
+        self._touch(consignment)
+        self.db.commit()
+        self.db.refresh(consignment)
+        return consignment
+
+    def list_consignments(self, skip: int, limit: int) -> Tuple[List[Consignment], int]:
+        total = self.db.query(Consignment).count()
+        consignments = self.db.query(Consignment)\
+            .order_by(Consignment.created_at.desc())\
+            .offset(skip)\
+            .limit(limit)\
+            .all()
+        return consignments, total
+
+    def delete_consignment(self, consignment: Consignment) -> None:
+        self.db.delete(consignment)
+        self.db.commit()
+
+    def release(self) -> None:
+        """Return the session's connection to the pool; the next query checks one out again"""
+        self.db.close()
+
+    def export_consignments(
+        self, status: Optional[ConsignmentStatus], created_from: Optional[datetime], created_to: Optional[datetime]
+    ) -> Iterator[Dict[str, Any]]:
+        query = select(*(getattr(Consignment, field) for field in EXPORT_FIELDS))\
+            .order_by(Consignment.created_at, Consignment.id)
+        if status is not None:
+            query = query.where(Consignment.status == status)
+        if created_from is not None:
+            query = query.where(Consignment.created_at >= created_from)
+        if created_to is not None:
+            query = query.where(Consignment.created_at < created_to)
+        return _stream_rows(self.db.get_bind(), query)
+
+    def add_attachment(self, consignment: Consignment, attachment: Dict[str, Any]) -> None:
+        # Lock the row so concurrent uploads to the same consignment don't drop each other
+        locked = self.db.query(Consignment)\
+            .filter(Consignment.id == consignment.id)\
+            .with_for_update()\
+            .populate_existing()\
+            .one()
+        locked.attachment_files = _with_attachment(locked.attachment_files, attachment)
+        self._touch(locked)
+        self.db.commit()
+
+    def save_verdict(self, consignment: Consignment, status: ConsignmentStatus, violations: List[Dict[str, Any]]) -> None:
+        if self.group_committer is not None:
+            # Release our connection, then wait until the group holding this update has committed
+            consignment_id = consignment.id
+            self.db.close()
+            future = self.group_committer.submit(consignment_id, status, violations)
+            try:
+                future.result(timeout=GROUP_COMMIT_TIMEOUT_S)
+            except FutureTimeoutError:
+                raise GroupCommitTimeout(f"Verdict for consignment {consignment_id} was not committed within "
+                                         f"{GROUP_COMMIT_TIMEOUT_S:g}s") from None
+        else:
+            consignment.status = status
+            consignment.violations = violations
+            self._touch(consignment)
+            self.db.commit()
+
+    def save_verdicts(self, verdicts: List[Verdict]) -> None:
+        # Commit all changes at once
+        for consignment, status, violations in verdicts:
+            consignment.status = status
+            consignment.violations = violations
+            self._touch(consignment)
+        self.db.commit()
+
+    def create_rule(self, data: Dict[str, Any]) -> Rule:
+        db_rule = Rule(**data)
+        self.db.add(db_rule)
+        self._bump_rule_set_version()
+        self.db.commit()
+        self.db.refresh(db_rule)
+        return db_rule
+
+    def get_rule(self, rule_id: uuid.UUID) -> Optional[Rule]:
+        return self.db.query(Rule).filter(Rule.id == rule_id).first()
+
+    def get_active_rules(self) -> List[Rule]:
+        return self.db.query(Rule).filter(Rule.status == 'active').all()
+
+    def get_rule_set_version(self) -> int:
+        return self.db.execute(select(RuleSetVersion.version).where(RuleSetVersion.id == 1)).scalar() or 0
+
+    def update_rule(self, rule: Rule, data: Dict[str, Any]) -> Rule:
+        for field, value in data.items():
+            setattr(rule, field, value)
+        self._touch(rule)
+        self._bump_rule_set_version()
+        self.db.commit()
+        self.db.refresh(rule)
+        return rule
+
+    def delete_rule(self, rule: Rule) -> None:
+        self.db.delete(rule)
+        self._bump_rule_set_version()
+        self.db.commit()
+
+    def list_datasets(self) -> List[ReferenceDataset]:
+        return self.db.query(ReferenceDataset).order_by(ReferenceDataset.name).all()
+
+    def get_dataset(self, name: str) -> Optional[ReferenceDataset]:
+        return self.db.query(ReferenceDataset).filter(ReferenceDataset.name == name).first()
+
+    def get_dataset_versions(self) -> Dict[str, int]:
+        return dict(self.db.execute(select(ReferenceDataset.name, ReferenceDataset.version)).all())
+
+    def save_dataset(self, name: str, description: str, entries: List[str]) -> ReferenceDataset:
+        dataset = self.get_dataset(name)
+        if dataset is None:
+            dataset = ReferenceDataset(name=name)
+            self.db.add(dataset)
+        else:
+            self._touch(dataset)
+        dataset.description = description
+        dataset.entries = entries
+        dataset.size = len(entries)
+        self.db.commit()
+        self.db.refresh(dataset)
+        return dataset
+
+    def delete_dataset(self, dataset: ReferenceDataset) -> None:
+        self.db.delete(dataset)
+        self.db.commit()
+
+    @staticmethod
+    def _touch(record: Any) -> None:
+        # Increment in SQL so concurrent writers don't lose a bump
+        record.version = type(record).version + 1
+        record.updated_at = datetime.utcnow()
+
+    def _bump_rule_set_version(self) -> None:
+        # The row is seeded with the schema (create_schema or the migration), never inserted here
+        self.db.execute(
+            update(RuleSetVersion).where(RuleSetVersion.id == 1).values(version=RuleSetVersion.version + 1)
+        )
+
+
+class SQLStorage:
+    """
+    Storage backed by a relational database.
+
+    The engine is created and tables are created (if `create_tables`) when the
+    storage is opened, not at import time.
+    """
+
+    def __init__(self, engine: Optional[Engine] = None, create_tables: bool = DATABASE_CREATE_TABLES):
+        self.engine = engine
+        self.create_tables = create_tables
+        self.session_factory: Optional[sessionmaker] = None
+        self.group_committer: Optional[GroupCommitter] = None
+
+    def open(self) -> None:
+        if self.engine is None:
+            self.engine = get_engine()
+        if self.create_tables:
+            create_schema(self.engine)
+        self.session_factory = sessionmaker(autocommit=False, autoflush=False, bind=self.engine)
+        # Coalesces verdict updates from concurrent compliance checks when enabled
+        if GROUP_COMMIT_ENABLED:
+            self.group_committer = GroupCommitter(self.session_factory)
+
+    def close(self) -> None:
+        if self.group_committer is not None:
+            self.group_committer.close()
+            self.group_committer = None
+
+    def repository(self) -> Iterator[SQLRepository]:
+        db = self.session_factory()
+        try:
+            yield SQLRepository(db, self.group_committer)
+        finally:
+            db.close()
+
+
+# In-memory backend
+
+class InMemoryStorage:
+    """
+    Storage that keeps consignments and rules in process memory.
+
+    Intended for embedded use, tests and benchmarks; nothing is persisted.
+    """
+
+    def __init__(self):
+        self.consignments: Dict[uuid.UUID, Consignment] = {}
+        self.rules: Dict[uuid.UUID, Rule] = {}
+        self.rule_set_version = 0
+        self.datasets: Dict[str, ReferenceDataset] = {}
+        self.lock = threading.RLock()
+
+    def open(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+    def repository(self) -> Iterator["InMemoryRepository"]:
+        yield InMemoryRepository(self)
+
+
+class InMemoryRepository:
+    """Repository over an InMemoryStorage, mirroring SQLRepository"""
+
+    def __init__(self, storage: InMemoryStorage):
+        self.storage = storage
+
+    def create_consignment(self, data: Dict[str, Any]) -> Consignment:
+        consignment = Consignment(
+            id=uuid.uuid4(),
+            status=ConsignmentStatus.PENDING,
+            violations=[],
+            attachment_files=[],
+            created_at=datetime.utcnow(),
+            version=1,
+            updated_at=datetime.utcnow(),
+            **data,
+        )
+        with self.storage.lock:
+            self.storage.consignments[consignment.id] = consignment
+        return consignment
+
+    def get_consignment(self, consignment_id: uuid.UUID) -> Optional[Consignment]:
+        return self.storage.consignments.get(consignment_id)
+
+    def get_consignment_version(self, consignment_id: uuid.UUID) -> Optional[int]:
+        consignment = self.storage.consignments.get(consignment_id)
+        return consignment.version if consignment else None
+
+    def update_consignment(self, consignment: Consignment, data: Dict[str, Any]) -> Consignment:
+        with self.storage.lock:
+            for field, value in data.items():
+                setattr(consignment, field, value)
+            _touch(consignment)
+        return consignment
+
+    def list_consignments(self, skip: int, limit: int) -> Tuple[List[Consignment], int]:
+        with self.storage.lock:
+            consignments = list(self.storage.consignments.values())
+        consignments.sort(key=lambda consignment: consignment.created_at, reverse=True)
+        return consignments[skip:skip + limit], len(consignments)
+
+    def delete_consignment(self, consignment: Consignment) -> None:
+        with self.storage.lock:
+            self.storage.consignments.pop(consignment.id, None)
+
+    def release(self) -> None:
+        pass
+
+    def export_consignments(
+        self, status: Optional[ConsignmentStatus], created_from: Optional[datetime], created_to: Optional[datetime]
+    ) -> Iterator[Dict[str, Any]]:
+        # Copy the matching rows under the lock so the export is a consistent snapshot
+        with self.storage.lock:
+            rows = [
+                {field: getattr(consignment, field) for field in EXPORT_FIELDS}
+                for consignment in self.storage.consignments.values()
+                if _export_filter(consignment, status, created_from, created_to)
+            ]
+        rows.sort(key=lambda row: (row["created_at"], str(row["id"])))
+        return iter(rows)
+
+    def add_attachment(self, consignment: Consignment, attachment: Dict[str, Any]) -> None:
+        with self.storage.lock:
+            consignment.attachment_files = _with_attachment(consignment.attachment_files, attachment)
+            _touch(consignment)
+
+    def save_verdict(self, consignment: Consignment, status: ConsignmentStatus, violations: List[Dict[str, Any]]) -> None:
+        self.save_verdicts([(consignment, status, violations)])
+
+    def save_verdicts(self, verdicts: List[Verdict]) -> None:
+        with self.storage.lock:
+            for consignment, status, violations in verdicts:
+                consignment.status = status
+                consignment.violations = violations
+                _touch(consignment)
+
+    def create_rule(self, data: Dict[str, Any]) -> Rule:
+        rule = Rule(id=uuid.uuid4(), version=1, updated_at=datetime.utcnow(), **data)
+        with self.storage.lock:
+            self.storage.rules[rule.id] = rule
+            self.storage.rule_set_version += 1
+        return rule
+
+    def get_rule(self, rule_id: uuid.UUID) -> Optional[Rule]:
+        return self.storage.rules.get(rule_id)
+
+    def get_active_rules(self) -> List[Rule]:
+        with self.storage.lock:
+            return [rule for rule in self.storage.rules.values() if rule.status == 'active']
+
+    def get_rule_set_version(self) -> int:
+        return self.storage.rule_set_version
+
+    def update_rule(self, rule: Rule, data: Dict[str, Any]) -> Rule:
+        with self.storage.lock:
+            for field, value in data.items():
+                setattr(rule, field, value)
+            _touch(rule)
+            self.storage.rule_set_version += 1
+        return rule
+
+    def delete_rule(self, rule: Rule) -> None:
+        with self.storage.lock:
+            self.storage.rules.pop(rule.id, None)
+            self.storage.rule_set_version += 1
+
+    def list_datasets(self) -> List[ReferenceDataset]:
+        with self.storage.lock:
+            return sorted(self.storage.datasets.values(), key=lambda dataset: dataset.name)
+
+    def get_dataset(self, name: str) -> Optional[ReferenceDataset]:
+        return self.storage.datasets.get(name)
+
+    def get_dataset_versions(self) -> Dict[str, int]:
+        with self.storage.lock:
+            return {name: dataset.version for name, dataset in self.storage.datasets.items()}
+
+    def save_dataset(self, name: str, description: str, entries: List[str]) -> ReferenceDataset:
+        with self.storage.lock:
+            dataset = self.storage.datasets.get(name)
+            if dataset is None:
+                dataset = ReferenceDataset(id=uuid.uuid4(), name=name, version=1, updated_at=datetime.utcnow())
+                self.storage.datasets[name] = dataset
+            else:
+                _touch(dataset)
+            dataset.description = description
+            dataset.entries = entries
+            dataset.size = len(entries)
+        return dataset
+
+    def delete_dataset(self, dataset: ReferenceDataset) -> None:
+        with self.storage.lock:
+            self.storage.datasets.pop(dataset.name, None)
@@ -1,8 +1,24 @@
 import ast
 import operator
-from typing import Any, Dict, List, Tuple, Protocol
+import os
+import time
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple, Protocol
 from schemas import Violation, ConsignmentStatus
 
+# Per-rule evaluation budget; 0 disables a limit. The step budget grows with
+# the consignment's item count (see RuleEvaluator.step_budget), so a rule that
+# passed the cost check can always finish. The wall-time limit is opt-in since
+# it makes verdicts depend on server load.
+RULE_MAX_STEPS = int(os.getenv("RULE_MAX_STEPS", "100000"))
+RULE_MAX_SECONDS = float(os.getenv("RULE_MAX_SECONDS", "0"))
+
+# Static cost limits checked when rules are created or updated
+RULE_COST_WARN = int(os.getenv("RULE_COST_WARN", "10000"))
+RULE_MAX_ESTIMATED_COST = int(os.getenv("RULE_MAX_ESTIMATED_COST", str(RULE_MAX_STEPS)))
+# Number of elements assumed for iterables whose size is unknown before evaluation
+RULE_COST_ASSUMED_ITEMS = int(os.getenv("RULE_COST_ASSUMED_ITEMS", "1000"))
+
 class RuleInterface(Protocol):
     """Protocol defining the required attributes for a Rule"""
     id: str
@@ -20,6 +36,151 @@ class Rule:
         self.condition = condition.strip()
         self.status = 'active'
 
+# Fields every item needs for the aggregates to stand in for scanning the items
+ITEM_AGGREGATE_FIELDS = ('name', 'value', 'weight', 'requires_clearance')
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+def compute_item_aggregates(items: Any) -> Optional[Dict[str, Any]]:
+    """
+    Summarize a consignment's items in a single pass.
+    The result is JSON serializable so it can be stored with the consignment.
+
+    Returns None unless `items` is a list of items that all have every field in
+    ITEM_AGGREGATE_FIELDS with a str name and a numeric value and weight; rules
+    then scan the items as written, so malformed items fail those rules instead
+    of being summarized with made-up defaults.
+    """
+    if not isinstance(items, list):
+        return None
+    for item in items:
+        if (not isinstance(item, dict) or any(field not in item for field in ITEM_AGGREGATE_FIELDS)
+                or not _is_number(item['value']) or not _is_number(item['weight'])
+                or not isinstance(item['name'], str)):
+            return None
+
+    total_value = 0.0
+    total_weight = 0.0
+    max_value: Optional[float] = None
+    max_weight: Optional[float] = None
+    any_requires_clearance = False
+    names = set()
+    for item in items:
+        value = item['value']
+        weight = item['weight']
+        total_value += value
+        total_weight += weight
+        if max_value is None or value > max_value:
+            max_value = value
+        if max_weight is None or weight > max_weight:
+            max_weight = weight
+        any_requires_clearance = any_requires_clearance or bool(item['requires_clearance'])
+        names.add(item['name'])
+
+    return {
+        'item_count': len(items),
+        'total_item_value': total_value,
+        'max_item_value': max_value,
+        'total_item_weight': total_weight,
+        'max_item_weight': max_weight,
+        'any_requires_clearance': any_requires_clearance,
+        'item_names': sorted(name for name in names if name is not None),
+    }
+
+def _size(items: Any) -> int:
+    try:
+        return len(items)
+    except TypeError:
+        return 0
+
+class ItemAggregateRewriter(ast.NodeTransformer):
+    """
+    Rewrites common scans over `items` into lookups of the precomputed item
+    aggregates, e.g. `any(item.get('requires_clearance') for item in items)`
+    becomes `any_requires_clearance` and `sum(i['value'] for i in items)`
+    becomes `total_item_value`.
+    """
+
+    # (function, item field) -> aggregate variable
+    CALL_PATTERNS = {
+        ('any', 'requires_clearance'): 'any_requires_clearance',
+        ('sum', 'value'): 'total_item_value',
+        ('sum', 'weight'): 'total_item_weight',
+        ('max', 'value'): 'max_item_value',
+        ('max', 'weight'): 'max_item_weight',
+    }
+
+    @staticmethod
+    def _scanned_field(node: ast.AST, allow_set: bool = False) -> Optional[str]:
+        """
+        Return `field` if node is `x[field]`/`x.get(field)` for each `x` in
+        `items`. Set comprehensions drop duplicates, so they only match when
+        `allow_set` is given (for membership tests).
+        """
+        kinds = (ast.GeneratorExp, ast.ListComp, ast.SetComp) if allow_set else (ast.GeneratorExp, ast.ListComp)
+        if not isinstance(node, kinds) or len(node.generators) != 1:
+            return None
+        generator = node.generators[0]
+        if (generator.ifs or generator.is_async or not isinstance(generator.target, ast.Name)
+                or not isinstance(generator.iter, ast.Name) or generator.iter.id != 'items'):
+            return None
+        target = generator.target.id
+        elt = node.elt
+        if (isinstance(elt, ast.Subscript) and isinstance(elt.value, ast.Name) and elt.value.id == target
+                and isinstance(elt.slice, ast.Constant)):
+            return elt.slice.value
+        if (isinstance(elt, ast.Call) and isinstance(elt.func, ast.Attribute) and elt.func.attr == 'get'
+                and isinstance(elt.func.value, ast.Name) and elt.func.value.id == target
+                and len(elt.args) == 1 and isinstance(elt.args[0], ast.Constant) and not elt.keywords):
+            return elt.args[0].value
+        return None
+
+    def visit_Call(self, node: ast.Call) -> ast.AST:
+        self.generic_visit(node)
+        if isinstance(node.func, ast.Name) and len(node.args) == 1 and not node.keywords:
+            arg = node.args[0]
+            if node.func.id == 'len' and isinstance(arg, ast.Name) and arg.id == 'items':
+                return ast.copy_location(ast.Name(id='item_count', ctx=ast.Load()), node)
+            aggregate = self.CALL_PATTERNS.get((node.func.id, self._scanned_field(arg)))
+            if aggregate:
+                return ast.copy_location(ast.Name(id=aggregate, ctx=ast.Load()), node)
+        return node
+
+    def visit_Compare(self, node: ast.Compare) -> ast.AST:
+        self.generic_visit(node)
+        # `x in [item['name'] for item in items]` -> `x in item_names`
+        comparators = []
+        for op, comparator in zip(node.ops, node.comparators):
+            if isinstance(op, (ast.In, ast.NotIn)) and self._scanned_field(comparator, allow_set=True) == 'name':
+                comparator = ast.copy_location(ast.Name(id='item_names', ctx=ast.Load()), comparator)
+            comparators.append(comparator)
+        node.comparators = comparators
+        return node
+
+class BudgetExceeded(Exception):
+    """Raised when evaluating a rule exceeds its step or time budget"""
+
+class EvaluationBudget:
+    """Step and wall-time limits for evaluating a single rule"""
+
+    # Read the clock only every so many steps to keep step() cheap
+    CLOCK_CHECK_INTERVAL = 256
+
+    def __init__(self, max_steps: int = RULE_MAX_STEPS, max_seconds: float = RULE_MAX_SECONDS):
+        self.max_steps = max_steps
+        self.max_seconds = max_seconds
+        self.steps = 0
+        self.deadline = time.perf_counter() + max_seconds if max_seconds else None
+
+    def step(self) -> None:
+        self.steps += 1
+        if self.max_steps and self.steps > self.max_steps:
+            raise BudgetExceeded(f"Rule exceeded its budget of {self.max_steps} evaluation steps")
+        if (self.deadline is not None and self.steps % self.CLOCK_CHECK_INTERVAL == 0
+                and time.perf_counter() > self.deadline):
+            raise BudgetExceeded(f"Rule exceeded its budget of {self.max_seconds}s evaluation time")
+
 class RuleEvaluator:
     """Evaluates rule conditions safely using AST parsing"""
     
@@ -34,49 +195,148 @@ class RuleEvaluator:
         ast.NotIn: lambda a, b: a not in b,
     }
 
+    BIN_OPERATORS = {
+        ast.Add: operator.add,
+        ast.Sub: operator.sub,
+        ast.Mult: operator.mul,
+        ast.Div: operator.truediv,
+    }
+
+    UNARY_OPERATORS = {
+        ast.Not: operator.not_,
+        ast.USub: operator.neg,
+    }
+
+    SAFE_FUNCTIONS = {
+        'len': len,
+        'str': str,
+        'int': int,
+        'float': float,
+        'bool': bool,
+        'any': any,
+        'all': all,
+        'sum': sum,
+        'min': min,
+        'max': max,
+    }
+
+    # Functions supplied per evaluation: keys() and ref(name) for reference datasets
+    CONTEXT_FUNCTIONS = ('keys', 'ref')
+
+    @staticmethod
+    @lru_cache(maxsize=1024)
+    def compile(rule_str: str, use_item_aggregates: bool = False) -> ast.AST:
+        """Parse a rule once, optionally rewriting item scans to use the item aggregates"""
+        tree = ast.parse(rule_str, mode='eval')
+        if use_item_aggregates:
+            tree = ast.fix_missing_locations(ItemAggregateRewriter().visit(tree))
+        return tree.body
+
+    @classmethod
+    def estimate_cost(cls, rule_str: str, assumed_items: int = RULE_COST_ASSUMED_ITEMS,
+                      use_item_aggregates: bool = True) -> int:
+        """
+        Roughly estimate the evaluation steps a rule needs, by default after
+        item scans are rewritten to aggregates. Iterables of unknown size are
+        assumed to hold `assumed_items` elements. Raises SyntaxError for
+        invalid rules.
+        """
+        return cls._estimate_node(cls.compile(rule_str, use_item_aggregates), assumed_items)
+
     @classmethod
-    def evaluate(cls, rule_str: str, context: Dict[str, Any]) -> Tuple[bool, List[Dict[str, Any]]]:
+    @lru_cache(maxsize=4096)
+    def step_budget(cls, rule_str: str, item_count: int, use_item_aggregates: bool) -> int:
+        """
+        Steps a rule may take for a consignment with `item_count` items.
+
+        Rules the cost check would accept get twice their estimated cost at
+        that item count when that is more than RULE_MAX_STEPS, so large
+        consignments are not failed by an accepted rule. Any other rule gets
+        RULE_MAX_STEPS.
+        """
+        if not RULE_MAX_STEPS:
+            return 0
+        try:
+            if cls.estimate_cost(rule_str) > (RULE_MAX_ESTIMATED_COST or RULE_MAX_STEPS):
+                return RULE_MAX_STEPS
+            estimate = cls.estimate_cost(rule_str, max(item_count, 1), use_item_aggregates)
+        except SyntaxError:
+            return RULE_MAX_STEPS
+        return max(RULE_MAX_STEPS, 2 * estimate)
+
+    @classmethod
+    def _estimate_node(cls, node: ast.AST, assumed_items: int) -> int:
+        if isinstance(node, (ast.GeneratorExp, ast.ListComp, ast.SetComp)):
+            cost = 1
+            per_element = cls._estimate_node(node.elt, assumed_items)
+            for generator in node.generators:
+                cost += cls._estimate_node(generator.iter, assumed_items)
+                per_element += sum(cls._estimate_node(cond, assumed_items) for cond in generator.ifs)
+                size = len(generator.iter.elts) if isinstance(generator.iter, (ast.List, ast.Tuple)) else assumed_items
+                per_element *= size
+            return cost + per_element
+
+        cost = 1
+        if isinstance(node, ast.Compare):
+            # Membership tests against a list scan it
+            for op, comparator in zip(node.ops, node.comparators):
+                if isinstance(op, (ast.In, ast.NotIn)) and isinstance(comparator, (ast.List, ast.Tuple)):
+                    cost += len(comparator.elts)
+        for child in ast.iter_child_nodes(node):
+            if isinstance(child, ast.expr):
+                cost += cls._estimate_node(child, assumed_items)
+        return cost
+
+    @classmethod
+    def evaluate(cls, rule_str: str, context: Dict[str, Any],
+                 budget: Optional[EvaluationBudget] = None) -> Tuple[bool, List[Dict[str, Any]]]:
         """
         Safely evaluate the rule string within the given context.
         Returns a tuple: (overall_result, list_of_violation_details)
+        An evaluation error, including an exceeded budget, is reported as a
+        violation detail with an "error" key.
         """
+        if budget is None:
+            budget = EvaluationBudget()
         safe_namespace = context.copy()
-        safe_namespace.update({
-            'len': len,
-            'str': str,
-            'int': int,
-            'float': float,
-            'bool': bool,
-            'any': any,
-            'all': all,
-            'keys': lambda: list(context.keys()),
-        })
+        safe_namespace.update(cls.SAFE_FUNCTIONS)
+        safe_namespace['keys'] = lambda: list(context.keys())
 
         violations: List[Dict[str, Any]] = []
         try:
-            tree = ast.parse(rule_str, mode='eval')
-            result = cls._eval_node(tree.body, safe_namespace, violations)
+            tree = cls.compile(rule_str, 'item_count' in context)
+            result = cls._eval_node(tree, safe_namespace, violations, budget)
             return result, violations
+        except BudgetExceeded as e:
+            violations.append({"error": str(e), "expression": rule_str, "budget_exceeded": True})
+            return False, violations
         except Exception as e:
             violations.append({"error": str(e), "expression": rule_str})
             return False, violations
 
     @classmethod
-    def _eval_node(cls, node: ast.AST, namespace: Dict[str, Any], violations: List[Dict[str, Any]]) -> Any:
+    def _eval_node(cls, node: ast.AST, namespace: Dict[str, Any], violations: List[Dict[str, Any]],
+                   budget: EvaluationBudget) -> Any:
+        budget.step()
         if isinstance(node, ast.BoolOp):
+            # Short-circuit like Python: later operands are not evaluated once the result is known
             if isinstance(node.op, ast.And):
-                results = [cls._eval_node(value, namespace, violations) for value in node.values]
-                return all(results)
+                for value in node.values:
+                    if not cls._eval_node(value, namespace, violations, budget):
+                        return False
+                return True
             elif isinstance(node.op, ast.Or):
-                results = [cls._eval_node(value, namespace, violations) for value in node.values]
-                return any(results)
+                for value in node.values:
+                    if cls._eval_node(value, namespace, violations, budget):
+                        return True
+                return False
             else:
                 raise ValueError(f"Unsupported boolean operator: {node.op}")
         elif isinstance(node, ast.Compare):
-            left = cls._eval_node(node.left, namespace, violations)
+            left = cls._eval_node(node.left, namespace, violations, budget)
             result = True
             for op, comparator in zip(node.ops, node.comparators):
-                right = cls._eval_node(comparator, namespace, violations)
+                right = cls._eval_node(comparator, namespace, violations, budget)
                 op_func = cls.OPERATORS.get(type(op))
                 if op_func is None:
                     raise ValueError(f"Unsupported operator: {op}")
@@ -91,43 +351,236 @@ class RuleEvaluator:
                     break
                 left = right
             return result
-        elif isinstance(node, (ast.Constant, ast.Num, ast.Str, ast.NameConstant)):
-            return node.value if hasattr(node, 'value') else node.n
+        elif isinstance(node, ast.Constant):
+            return node.value
         elif isinstance(node, ast.Name):
             if node.id in namespace:
                 return namespace[node.id]
             else:
                 raise ValueError(f"Unknown variable: {node.id}")
-        elif isinstance(node, ast.List):
-            return [cls._eval_node(elt, namespace, violations) for elt in node.elts]
+        elif isinstance(node, (ast.List, ast.Tuple)):
+            return [cls._eval_node(elt, namespace, violations, budget) for elt in node.elts]
+        elif isinstance(node, ast.UnaryOp):
+            op_func = cls.UNARY_OPERATORS.get(type(node.op))
+            if op_func is None:
+                raise ValueError(f"Unsupported operator: {ast.unparse(node.op)}")
+            return op_func(cls._eval_node(node.operand, namespace, violations, budget))
+        elif isinstance(node, ast.BinOp):
+            op_func = cls.BIN_OPERATORS.get(type(node.op))
+            if op_func is None:
+                raise ValueError(f"Unsupported operator: {ast.unparse(node.op)}")
+            left = cls._eval_node(node.left, namespace, violations, budget)
+            right = cls._eval_node(node.right, namespace, violations, budget)
+            # Arithmetic only: `[0] * n` or string concatenation could build huge values in one step
+            if not isinstance(left, (int, float)) or not isinstance(right, (int, float)):
+                raise ValueError(
+                    f"Operator {ast.unparse(node.op)} is only supported on numbers, "
+                    f"not {type(left).__name__} and {type(right).__name__}"
+                )
+            return op_func(left, right)
+        elif isinstance(node, ast.Subscript):
+            return cls._eval_node(node.value, namespace, violations, budget)[cls._eval_node(node.slice, namespace, violations, budget)]
+        elif isinstance(node, ast.Call):
+            return cls._eval_call(node, namespace, violations, budget)
+        elif isinstance(node, (ast.GeneratorExp, ast.ListComp, ast.SetComp)):
+            return cls._eval_comprehension(node, namespace, violations, budget)
         else:
             raise ValueError(f"Unsupported expression: {ast.unparse(node).strip()}")
 
+    @classmethod
+    def _eval_call(cls, node: ast.Call, namespace: Dict[str, Any], violations: List[Dict[str, Any]],
+                   budget: EvaluationBudget) -> Any:
+        if node.keywords:
+            raise ValueError(f"Unsupported expression: {ast.unparse(node).strip()}")
+        args = [cls._eval_node(arg, namespace, violations, budget) for arg in node.args]
+        # Only the safe functions and dict.get() may be called
+        if isinstance(node.func, ast.Name) and (node.func.id in cls.SAFE_FUNCTIONS or node.func.id in cls.CONTEXT_FUNCTIONS):
+            return namespace[node.func.id](*args)
+        if isinstance(node.func, ast.Attribute) and node.func.attr == 'get':
+            obj = cls._eval_node(node.func.value, namespace, violations, budget)
+            if isinstance(obj, dict):
+                return obj.get(*args)
+        raise ValueError(f"Unsupported function call: {ast.unparse(node.func).strip()}")
+
+    @classmethod
+    def _eval_comprehension(cls, node: ast.AST, namespace: Dict[str, Any], violations: List[Dict[str, Any]],
+                            budget: EvaluationBudget) -> Any:
+        if len(node.generators) != 1 or not isinstance(node.generators[0].target, ast.Name):
+            raise ValueError(f"Unsupported expression: {ast.unparse(node).strip()}")
+        generator = node.generators[0]
+        iterable = cls._eval_node(generator.iter, namespace, violations, budget)
+
+        def values():
+            scope = namespace.copy()
+            for value in iterable:
+                scope[generator.target.id] = value
+                if all(cls._eval_node(cond, scope, violations, budget) for cond in generator.ifs):
+                    yield cls._eval_node(node.elt, scope, violations, budget)
+
+        # Generator expressions stay lazy so any()/all() can stop early
+        if isinstance(node, ast.ListComp):
+            return list(values())
+        if isinstance(node, ast.SetComp):
+            return set(values())
+        return values()
+
+class EvaluationTrace(EvaluationBudget):
+    """
+    An evaluation budget that also records, for each node of the rule's
+    expression tree, how often it was evaluated and the time spent in it
+    (including its children).
+    """
+
+    def __init__(self, max_steps: int = RULE_MAX_STEPS, max_seconds: float = RULE_MAX_SECONDS):
+        super().__init__(max_steps, max_seconds)
+        self.root: Optional[ast.AST] = None
+        self.calls: Dict[int, int] = {}
+        self.seconds: Dict[int, float] = {}
+
+    def record(self, node: ast.AST, elapsed: float) -> None:
+        key = id(node)
+        self.calls[key] = self.calls.get(key, 0) + 1
+        self.seconds[key] = self.seconds.get(key, 0.0) + elapsed
+
+    def report(self) -> List[Dict[str, Any]]:
+        """
+        Node timings in tree order. Nodes that were never evaluated because an
+        enclosing `and`/`or`, comparison chain or any()/all() short-circuited
+        are marked `skipped`.
+        """
+        nodes: List[Dict[str, Any]] = []
+
+        def visit(node: ast.AST, depth: int) -> None:
+            key = id(node)
+            nodes.append({
+                "expression": ast.unparse(node),
+                "depth": depth,
+                "calls": self.calls.get(key, 0),
+                "time_ms": round(self.seconds.get(key, 0.0) * 1000, 4),
+                "skipped": key not in self.calls,
+            })
+            if isinstance(node, ast.Call):
+                # Function names are looked up directly, not evaluated; only dict.get() has a receiver
+                children = list(node.args)
+                if isinstance(node.func, ast.Attribute):
+                    children.insert(0, node.func.value)
+            else:
+                children = list(ast.iter_child_nodes(node))
+            for child in children:
+                if isinstance(child, ast.expr):
+                    visit(child, depth + 1)
+                elif isinstance(child, ast.comprehension):
+                    for part in [child.iter, *child.ifs]:
+                        visit(part, depth + 1)
+
+        if self.root is not None:
+            visit(self.root, 0)
+        return nodes
+
+class TracingEvaluator(RuleEvaluator):
+    """RuleEvaluator that times every node into an EvaluationTrace"""
+
+    @classmethod
+    def _eval_node(cls, node: ast.AST, namespace: Dict[str, Any], violations: List[Dict[str, Any]],
+                   budget: EvaluationBudget) -> Any:
+        if not isinstance(budget, EvaluationTrace):
+            return super()._eval_node(node, namespace, violations, budget)
+        if budget.root is None:
+            budget.root = node
+        start = time.perf_counter()
+        try:
+            return super()._eval_node(node, namespace, violations, budget)
+        finally:
+            budget.record(node, time.perf_counter() - start)
+
 class ComplianceEngine:
     """Engine for checking compliance against a set of rules"""
     
-    def __init__(self, rules: List[RuleInterface]):
-        """Initialize with a list of rules that implement RuleInterface"""
+    def __init__(self, rules: List[RuleInterface], datasets: Optional[Dict[str, Any]] = None):
+        """
+        Initialize with a list of rules that implement RuleInterface, and the
+        reference datasets rules can look up with ref(name)
+        """
         self.rules = [rule for rule in rules if rule.status == 'active']
+        self.datasets = datasets or {}
 
-    def check_compliance(self, consignment_data: Dict[str, Any]) -> Tuple[ConsignmentStatus, List[Violation]]:
+    def check_compliance(
+        self,
+        consignment_data: Dict[str, Any],
+        trace: Optional[List[Dict[str, Any]]] = None,
+    ) -> Tuple[ConsignmentStatus, List[Violation]]:
         """
         Check a consignment against all active rules.
-        Returns a tuple of (status, violations).
+        Returns a tuple of (status, violations); the status is PENDING when the
+        only violations are rules that exceeded their evaluation budget.
+        If a `trace` list is given, a timing breakdown per rule is appended to it.
         """
         violations: List[Violation] = []
-        
+        budget_errors = 0
+        context = self._build_context(consignment_data)
+        use_item_aggregates = 'item_count' in context
+        item_count = context['item_count'] if use_item_aggregates else _size(context.get('items'))
+
         for rule in self.rules:
-            passed, violation_info = RuleEvaluator.evaluate(rule.condition, consignment_data)
+            max_steps = RuleEvaluator.step_budget(rule.condition, item_count, use_item_aggregates)
+            if trace is None:
+                passed, violation_info = RuleEvaluator.evaluate(rule.condition, context, EvaluationBudget(max_steps))
+            else:
+                rule_trace = EvaluationTrace(max_steps)
+                start = time.perf_counter()
+                passed, violation_info = TracingEvaluator.evaluate(rule.condition, context, rule_trace)
+                trace.append({
+                    "rule_id": str(rule.id),
+                    "condition": rule.condition,
+                    "passed": passed,
+                    "time_ms": round((time.perf_counter() - start) * 1000, 4),
+                    "steps": rule_trace.steps,
+                    "nodes": rule_trace.report(),
+                })
             if not passed:
+                error = next((info["error"] for info in violation_info if "error" in info), None)
+                budget_errors += any(info.get("budget_exceeded") for info in violation_info)
+                if error is None:
+                    resolution_steps = f"Please check that your consignment complies with this rule"
+                else:
+                    resolution_steps = "This rule could not be evaluated; please review the rule"
                 violations.append(
                     Violation(
                         rule_id=str(rule.id),
                         description=rule.description,
                         condition_str=rule.condition,
-                        resolution_steps=f"Please check that your consignment complies with this rule"
+                        resolution_steps=resolution_steps,
+                        error=error,
                     )
                 )
 
-        status = ConsignmentStatus.VERIFIED if not violations else ConsignmentStatus.FLAGGED
-        return status, violations 
\ No newline at end of file
+        if not violations:
+            status = ConsignmentStatus.VERIFIED
+        elif budget_errors == len(violations):
+            # Only budget overruns: the verdict is undecided rather than flagged
+            status = ConsignmentStatus.PENDING
+        else:
+            status = ConsignmentStatus.FLAGGED
+        return status, violations
+
+    def _ref(self, name: str) -> Any:
+        if name not in self.datasets:
+            raise ValueError(f"Unknown reference dataset: {name}")
+        return self.datasets[name]
+
+    def _build_context(self, consignment_data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Expose the item aggregates as rule variables, using the stored ones
+        under `item_aggregates` when given and computing them otherwise,
+        plus ref() for the reference datasets. Without aggregates (malformed
+        items) rules are evaluated against `items` as written.
+        """
+        context = dict(consignment_data)
+        aggregates = context.pop('item_aggregates', None)
+        if aggregates is None:
+            aggregates = compute_item_aggregates(context.get('items'))
+        if aggregates is not None:
+            context.update(aggregates)
+            context['item_names'] = frozenset(aggregates['item_names'])
+        context['ref'] = self._ref
+        return context 
\ No newline at end of file
@@ -29,6 +29,16 @@ class Violation(BaseModel):
     # resolution_steps: Optional[str] = None
     resolution_steps: str
     condition_str: str
+    # Set when the rule could not be evaluated (e.g. it exceeded its budget)
+    error: Optional[str] = None
+
+class Attachment(BaseModel):
+    """Metadata for an uploaded attachment; contents are stored by SHA-256"""
+    filename: str
+    sha256: str
+    size: int
+    content_type: str
+    uploaded_at: datetime
 
 class ConsignmentBase(BaseModel):
     items: List[Item]
@@ -43,6 +53,7 @@ class ConsignmentResponse(ConsignmentBase):
     id: UUID4
     status: ConsignmentStatus
     violations: List[Violation] = []
+    attachment_files: List[Attachment] = []
     created_at: datetime
 
     class Config:
@@ -70,6 +81,8 @@ class ComplianceCheck(BaseModel):
 class ComplianceResponse(BaseModel):
     status: ConsignmentStatus
     violations: List[Violation] 
+    # Timing breakdown, only present for traced checks
+    trace: Optional[Dict[str, Any]] = None
 
 class BatchComplianceCheck(BaseModel):
     """Schema for batch compliance check request"""
@@ -85,3 +98,21 @@ class PaginatedConsignmentResponse(BaseModel):
     total: int
     skip: int
     limit: int
+
+class ReferenceDatasetCreate(BaseModel):
+    description: str = ""
+    entries: List[str]
+
+class ReferenceDatasetSummary(BaseModel):
+    id: UUID4
+    name: str
+    description: Optional[str] = None
+    size: int
+    version: int
+    updated_at: datetime
+
+    class Config:
+        from_attributes = True
+
+class ReferenceDatasetResponse(ReferenceDatasetSummary):
+    entries: List[str]
@@ -0,0 +1,250 @@
+"""
+Offline bulk screener: evaluate consignments against compliance rules without
+going through the HTTP API or the database.
+
+Consignments are streamed from NDJSON or CSV files (or stdin) and verdicts are
+streamed out as NDJSON, one line per consignment, so memory use stays constant
+regardless of input size. Progress and throughput are reported on stderr.
+
+CSV input needs `destination`, `customs_value` and `items` columns, where
+`items` is a JSON array of items; an `id` column is optional.
+
+Rules that use ref(name) need `--datasets`, a JSON object mapping dataset
+names to lists of entries.
+
+Usage:
+    python screener.py shipments.ndjson --rules rules.json --workers 8 > verdicts.ndjson
+    cat shipments.csv | python screener.py --format csv --rules-from-db
+"""
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import sys
+import time
+from collections import deque
+from typing import Any, Dict, IO, Iterable, Iterator, List, Optional
+
+from reference_data import ReferenceSet
+from rule_engine import ComplianceEngine, Rule
+
+PROGRESS_INTERVAL_SECONDS = 2.0
+
+# Per-process engine, built once by the pool initializer
+_engine: Optional[ComplianceEngine] = None
+
+
+def load_rules_from_file(path: str) -> List[Dict[str, Any]]:
+    """Load rules from a JSON array or NDJSON file"""
+    with open(path) as f:
+        content = f.read().strip()
+    if content.startswith("["):
+        return json.loads(content)
+    return [json.loads(line) for line in content.splitlines() if line.strip()]
+
+
+def load_rules_from_db() -> List[Dict[str, Any]]:
+    """Load the active rules from the database configured by DATABASE_URL"""
+    from repository import SQLStorage
+
+    storage = SQLStorage(create_tables=False)
+    storage.open()
+    repositories = storage.repository()
+    try:
+        repo = next(repositories)
+        return [
+            {
+                "id": str(rule.id),
+                "name": rule.name,
+                "description": rule.description,
+                "condition": rule.condition,
+                "status": rule.status,
+            }
+            for rule in repo.get_active_rules()
+        ]
+    finally:
+        repositories.close()
+        storage.close()
+
+
+def load_datasets_from_file(path: str) -> Dict[str, List[str]]:
+    """Load reference datasets from a JSON object of name -> entries"""
+    with open(path) as f:
+        datasets = json.load(f)
+    if not isinstance(datasets, dict):
+        raise ValueError(f"{path}: expected a JSON object of dataset name -> entries")
+    return datasets
+
+
+def build_engine(rule_dicts: List[Dict[str, Any]], datasets: Optional[Dict[str, List[str]]] = None) -> ComplianceEngine:
+    rules = []
+    for index, rule_dict in enumerate(rule_dicts):
+        rule = Rule(
+            id=str(rule_dict.get("id", index)),
+            name=rule_dict.get("name", ""),
+            description=rule_dict.get("description", ""),
+            condition=rule_dict["condition"],
+        )
+        rule.status = rule_dict.get("status", "active")
+        rules.append(rule)
+    reference_sets = {name: ReferenceSet(name, 1, entries) for name, entries in (datasets or {}).items()}
+    return ComplianceEngine(rules, reference_sets)
+
+
+def read_records(stream: IO[str], fmt: str) -> Iterator[Dict[str, Any]]:
+    """Yield raw consignment records from an NDJSON or CSV stream"""
+    if fmt == "csv":
+        for row_number, row in enumerate(csv.DictReader(stream), start=1):
+            try:
+                row["items"] = json.loads(row.get("items") or "[]")
+            except json.JSONDecodeError as e:
+                row = {"id": row.get("id"), "_parse_error": f"Invalid items JSON on row {row_number}: {e}"}
+            yield row
+    else:
+        for line_number, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                # Report bad lines in the output instead of aborting the whole run
+                record = {"_parse_error": f"Invalid JSON on line {line_number}: {e}"}
+            if not isinstance(record, dict):
+                record = {"_parse_error": f"Expected a JSON object on line {line_number}, got {type(record).__name__}"}
+            yield record
+
+
+def iter_consignments(paths: List[str], fmt: Optional[str]) -> Iterator[Dict[str, Any]]:
+    """Stream records from each input path in turn; '-' reads stdin"""
+    for path in paths or ["-"]:
+        path_format = fmt or ("csv" if path.endswith(".csv") else "ndjson")
+        if path == "-":
+            yield from read_records(sys.stdin, path_format)
+        else:
+            with open(path, newline="") as f:
+                yield from read_records(f, path_format)
+
+
+def screen(record: Dict[str, Any], engine: ComplianceEngine) -> Dict[str, Any]:
+    """Evaluate one consignment record and return its verdict"""
+    result: Dict[str, Any] = {"id": record.get("id")}
+    if "_parse_error" in record:
+        result["error"] = record["_parse_error"]
+        return result
+    try:
+        # Prepare consignment data for rule evaluation
+        consignment_data = {
+            "destination": record["destination"],
+            "customs_value": float(record["customs_value"]),
+            "items": record.get("items", []),
+        }
+    except (KeyError, TypeError, ValueError) as e:
+        result["error"] = f"Invalid consignment: {e}"
+        return result
+
+    status, violations = engine.check_compliance(consignment_data)
+    result["status"] = status.value
+    result["violations"] = [violation.dict() for violation in violations]
+    return result
+
+
+def _init_worker(rule_dicts: List[Dict[str, Any]], datasets: Optional[Dict[str, List[str]]]) -> None:
+    global _engine
+    _engine = build_engine(rule_dicts, datasets)
+
+
+def _screen_chunk(chunk: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return [screen(record, _engine) for record in chunk]
+
+
+def _chunks(records: Iterable[Dict[str, Any]], size: int) -> Iterator[List[Dict[str, Any]]]:
+    chunk: List[Dict[str, Any]] = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def screen_all(
+    records: Iterable[Dict[str, Any]],
+    rule_dicts: List[Dict[str, Any]],
+    workers: int = 1,
+    chunk_size: int = 500,
+    datasets: Optional[Dict[str, List[str]]] = None,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Screen records in input order.
+
+    With several workers, at most `2 * workers` chunks are in flight at once,
+    so input is never read further ahead than that.
+    """
+    if workers <= 1:
+        engine = build_engine(rule_dicts, datasets)
+        for record in records:
+            yield screen(record, engine)
+        return
+
+    with multiprocessing.Pool(workers, initializer=_init_worker, initargs=(rule_dicts, datasets)) as pool:
+        pending = deque()
+        for chunk in _chunks(records, chunk_size):
+            pending.append(pool.apply_async(_screen_chunk, (chunk,)))
+            if len(pending) >= 2 * workers:
+                yield from pending.popleft().get()
+        while pending:
+            yield from pending.popleft().get()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("inputs", nargs="*", help="NDJSON or CSV files; '-' or nothing reads stdin")
+    parser.add_argument("--format", choices=["ndjson", "csv"], help="input format (default: by file extension, else ndjson)")
+    rules_group = parser.add_mutually_exclusive_group(required=True)
+    rules_group.add_argument("--rules", help="JSON or NDJSON file of rules")
+    rules_group.add_argument("--rules-from-db", action="store_true", help="load active rules from DATABASE_URL")
+    parser.add_argument("--datasets", help="JSON file mapping reference dataset names to entries, for ref()")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="number of processes")
+    parser.add_argument("--chunk-size", type=int, default=500, help="consignments sent to a worker at a time")
+    parser.add_argument("--output", "-o", help="output file (default: stdout)")
+    args = parser.parse_args(argv)
+
+    rule_dicts = load_rules_from_db() if args.rules_from_db else load_rules_from_file(args.rules)
+    datasets = load_datasets_from_file(args.datasets) if args.datasets else None
+    print(f"Loaded {len(rule_dicts)} rules", file=sys.stderr)
+
+    output = open(args.output, "w") if args.output else sys.stdout
+    processed = flagged = errors = 0
+    start = last_report = time.monotonic()
+    try:
+        records = iter_consignments(args.inputs, args.format)
+        for result in screen_all(records, rule_dicts, args.workers, args.chunk_size, datasets):
+            output.write(json.dumps(result) + "\n")
+            processed += 1
+            if "error" in result:
+                errors += 1
+            elif result["status"] == "flagged":
+                flagged += 1
+
+            now = time.monotonic()
+            if now - last_report >= PROGRESS_INTERVAL_SECONDS:
+                last_report = now
+                print(f"Screened {processed} consignments ({processed / (now - start):.0f}/sec)", file=sys.stderr)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+    elapsed = time.monotonic() - start
+    rate = processed / elapsed if elapsed > 0 else 0.0
+    print(
+        f"Done: {processed} consignments, {flagged} flagged, {errors} errors "
+        f"in {elapsed:.1f}s ({rate:.0f}/sec)",
+        file=sys.stderr,
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,71 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from admission import AdmissionController
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_single_checks_are_served_before_queued_batches():
+    async def scenario():
+        controller = AdmissionController(max_concurrent=1, batch_max_concurrent=1)
+        order = []
+
+        await controller.acquire("single")
+        batch = asyncio.create_task(controller.acquire("batch"))
+        await asyncio.sleep(0)
+        single = asyncio.create_task(controller.acquire("single"))
+        await asyncio.sleep(0)
+        batch.add_done_callback(lambda _: order.append("batch"))
+        single.add_done_callback(lambda _: order.append("single"))
+
+        controller.release("single")
+        await single
+        controller.release("single")
+        await batch
+        controller.release("batch")
+        return order, controller.stats()
+
+    order, stats = run(scenario())
+    assert order == ["single", "batch"]
+    assert stats["active"] == {"single": 0, "batch": 0}
+    assert stats["admitted"] == {"single": 2, "batch": 1}
+
+
+def test_batches_cannot_take_every_slot():
+    async def scenario():
+        controller = AdmissionController(max_concurrent=2, batch_max_concurrent=1, queue_timeout=0.01)
+        await controller.acquire("batch")
+        with pytest.raises(HTTPException) as rejected:
+            await controller.acquire("batch")
+        # The remaining slot is still available to a single check
+        await controller.acquire("single")
+        return rejected.value, controller.stats()
+
+    rejected, stats = run(scenario())
+    assert rejected.status_code == 503
+    assert rejected.headers["Retry-After"] == "1"
+    assert stats["rejected_timeout"]["batch"] == 1
+    assert stats["queued"] == {"single": 0, "batch": 0}
+
+
+def test_full_queue_is_rejected_immediately():
+    async def scenario():
+        controller = AdmissionController(max_concurrent=1, single_queue=1, queue_timeout=1)
+        await controller.acquire("single")
+        waiting = asyncio.create_task(controller.acquire("single"))
+        await asyncio.sleep(0)
+        with pytest.raises(HTTPException) as rejected:
+            await controller.acquire("single")
+        controller.release("single")
+        await waiting
+        return rejected.value, controller.stats()
+
+    rejected, stats = run(scenario())
+    assert rejected.status_code == 429
+    assert stats["rejected_queue_full"]["single"] == 1
+    assert stats["active"]["single"] == 1
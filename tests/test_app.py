@@ -0,0 +1,333 @@
+import csv
+import hashlib
+import io
+import json
+import uuid
+
+import pytest
+from fastapi.testclient import TestClient
+
+from attachments import AttachmentStore
+from main import create_app
+from rule_engine import ComplianceEngine
+from schemas import ConsignmentStatus, Violation
+from repository import InMemoryStorage, SQLStorage
+
+BASE_URL = "/api/v1"
+
+RULES = [
+    {
+        "name": "Restricted Countries Rule",
+        "condition": "destination not in ['Syria', 'North Korea', 'Iran']",
+        "description": "Shipments to restricted countries are not allowed",
+        "severity": "high",
+        "status": "active"
+    },
+    {
+        "name": "High Value Rule",
+        "condition": "customs_value < 50000",
+        "description": "High-value shipments require additional scrutiny",
+        "severity": "medium",
+        "status": "active"
+    },
+]
+
+
+def make_consignment(destination="Germany", value=5000):
+    return {
+        "items": [{"name": "Office Supplies", "value": value, "weight": 100, "requires_clearance": False}],
+        "destination": destination,
+        "customs_value": value,
+        "attachments": ["invoice.pdf"]
+    }
+
+
+@pytest.fixture
+def client(tmp_path):
+    with TestClient(create_app(InMemoryStorage(), AttachmentStore(str(tmp_path)))) as client:
+        for rule in RULES:
+            assert client.post(f"{BASE_URL}/rules", json=rule).status_code == 200
+        yield client
+
+
+def test_consignment_crud(client):
+    created = client.post(f"{BASE_URL}/consignments", json=make_consignment()).json()
+    assert created["status"] == "pending"
+
+    fetched = client.get(f"{BASE_URL}/consignments/{created['id']}").json()
+    assert fetched == created
+
+    updated = client.put(f"{BASE_URL}/consignments/{created['id']}", json=make_consignment("France")).json()
+    assert updated["destination"] == "France"
+
+    listing = client.get(f"{BASE_URL}/consignments").json()
+    assert listing["total"] == 1
+
+    assert client.delete(f"{BASE_URL}/consignments/{created['id']}").status_code == 204
+    assert client.get(f"{BASE_URL}/consignments/{created['id']}").status_code == 404
+
+
+def test_compliance_check_updates_consignment(client):
+    allowed = client.post(f"{BASE_URL}/consignments", json=make_consignment()).json()
+    blocked = client.post(f"{BASE_URL}/consignments", json=make_consignment("Iran", 75000)).json()
+
+    result = client.post(f"{BASE_URL}/compliance/check", json={"consignment_id": allowed["id"]}).json()
+    assert result == {"status": "verified", "violations": []}
+
+    result = client.post(f"{BASE_URL}/compliance/check", json={"consignment_id": blocked["id"]}).json()
+    assert result["status"] == "flagged"
+    assert len(result["violations"]) == 2
+
+    report = client.get(f"{BASE_URL}/consignments/{blocked['id']}/report").json()
+    assert report["status"] == "flagged"
+    assert len(report["violations"]) == 2
+
+
+def test_batch_check(client):
+    ids = [
+        client.post(f"{BASE_URL}/consignments", json=make_consignment(destination)).json()["id"]
+        for destination in ["Germany", "Syria", "USA"]
+    ]
+    response = client.post(f"{BASE_URL}/compliance/batch-check", json={"consignment_ids": ids}).json()
+    assert response["summary"] == {"total_processed": 3, "verified_count": 2, "flagged_count": 1}
+    assert client.get(f"{BASE_URL}/consignments/{ids[1]}").json()["status"] == "flagged"
+
+
+def test_undecided_checks_replace_the_stored_verdict(client, monkeypatch):
+    ids = [client.post(f"{BASE_URL}/consignments", json=make_consignment()).json()["id"] for _ in range(2)]
+    client.post(f"{BASE_URL}/compliance/check", json={"consignment_id": ids[0]})
+    client.post(f"{BASE_URL}/compliance/batch-check", json={"consignment_ids": ids[1:]})
+    assert [client.get(f"{BASE_URL}/consignments/{i}").json()["status"] for i in ids] == ["verified", "verified"]
+
+    over_budget = Violation(rule_id="r1", description="", resolution_steps="", condition_str="",
+                            error="Rule exceeded 10 evaluation steps")
+    monkeypatch.setattr(ComplianceEngine, "check_compliance",
+                        lambda self, data, trace=None: (ConsignmentStatus.PENDING, [over_budget]))
+    client.post(f"{BASE_URL}/compliance/check", json={"consignment_id": ids[0]})
+    client.post(f"{BASE_URL}/compliance/batch-check", json={"consignment_ids": ids[1:]})
+    for consignment_id in ids:
+        stored = client.get(f"{BASE_URL}/consignments/{consignment_id}").json()
+        assert stored["status"] == "pending"
+        assert stored["violations"] == [over_budget.dict()]
+
+
+def test_attachments_are_deduplicated_and_support_ranges(client, tmp_path):
+    first = client.post(f"{BASE_URL}/consignments", json=make_consignment()).json()
+    second = client.post(f"{BASE_URL}/consignments", json=make_consignment()).json()
+    content = b"invoice contents " * 10000
+    sha256 = hashlib.sha256(content).hexdigest()
+
+    raw = client.post(
+        f"{BASE_URL}/consignments/{first['id']}/attachments",
+        params={"filename": "invoice.pdf"},
+        content=content,
+    ).json()
+    assert raw["sha256"] == sha256
+    assert raw["size"] == len(content)
+    assert raw["content_type"] == "application/pdf"
+
+    multipart = client.post(
+        f"{BASE_URL}/consignments/{second['id']}/attachments",
+        files={"file": ("copy.txt", content, "text/plain")},
+    ).json()
+    assert multipart["sha256"] == sha256
+    assert multipart["content_type"] == "text/plain"
+
+    # Both consignments reference a single stored copy
+    assert len(list((tmp_path / sha256[:2]).iterdir())) == 1
+    assert client.get(f"{BASE_URL}/consignments/{second['id']}").json()["attachment_files"][0]["filename"] == "copy.txt"
+
+    url = f"{BASE_URL}/consignments/{first['id']}/attachments/{sha256}"
+    assert client.get(url).content == content
+    partial = client.get(url, headers={"Range": "bytes=0-6"})
+    assert partial.status_code == 206
+    assert partial.content == b"invoice"
+
+
+def test_attachment_download_requires_reference(client):
+    consignment = client.post(f"{BASE_URL}/consignments", json=make_consignment()).json()
+    response = client.get(f"{BASE_URL}/consignments/{consignment['id']}/attachments/{'0' * 64}")
+    assert response.status_code == 404
+
+
+def test_upload_to_unknown_consignment_stores_nothing(client, tmp_path):
+    response = client.post(
+        f"{BASE_URL}/consignments/{uuid.uuid4()}/attachments", params={"filename": "a.txt"}, content=b"data"
+    )
+    assert response.status_code == 404
+    assert not [path for path in tmp_path.rglob("*") if path.is_file()]
+
+
+def test_conditional_consignment_get(client):
+    created = client.post(f"{BASE_URL}/consignments", json=make_consignment()).json()
+    url = f"{BASE_URL}/consignments/{created['id']}"
+
+    first = client.get(url)
+    etag = first.headers["ETag"]
+    not_modified = client.get(url, headers={"If-None-Match": etag})
+    assert not_modified.status_code == 304
+    assert not_modified.content == b""
+
+    # Every write path bumps the version
+    client.post(f"{BASE_URL}/compliance/check", json={"consignment_id": created["id"]})
+    after_check = client.get(url, headers={"If-None-Match": etag})
+    assert after_check.status_code == 200
+    assert after_check.headers["ETag"] != etag
+
+    client.put(url, json=make_consignment("France"))
+    assert client.get(url, headers={"If-None-Match": after_check.headers["ETag"]}).status_code == 200
+
+
+def test_conditional_rules_get(client):
+    first = client.get(f"{BASE_URL}/rules")
+    etag = first.headers["ETag"]
+    assert client.get(f"{BASE_URL}/rules", headers={"If-None-Match": etag}).status_code == 304
+
+    rule_id = first.json()[0]["id"]
+    client.put(f"{BASE_URL}/rules/{rule_id}", json={**RULES[0], "status": "inactive"})
+    changed = client.get(f"{BASE_URL}/rules", headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert len(changed.json()) == 1
+
+    client.delete(f"{BASE_URL}/rules/{rule_id}")
+    assert client.get(f"{BASE_URL}/rules", headers={"If-None-Match": changed.headers["ETag"]}).status_code == 200
+
+
+def test_expensive_rules_are_rejected(client):
+    nested = "any(a['value'] > 1 for a in items if all(c['value'] >= 0 for c in items))"
+    response = client.post(f"{BASE_URL}/rules", json={**RULES[0], "condition": nested})
+    assert response.status_code == 422
+    assert "too expensive" in response.json()["detail"]
+
+    response = client.post(f"{BASE_URL}/rules", json={**RULES[0], "condition": "destination in ["})
+    assert response.status_code == 422
+
+
+def test_check_trace_requires_admin(client, monkeypatch, tmp_path):
+    import main
+    import tracing
+
+    consignment = client.post(f"{BASE_URL}/consignments", json=make_consignment("Iran")).json()
+    url = f"{BASE_URL}/compliance/check"
+    body = {"consignment_id": consignment["id"]}
+    assert client.post(url, params={"trace": True}, json=body).status_code == 403
+
+    monkeypatch.setattr(main, "ADMIN_TOKEN", "secret")
+    monkeypatch.setattr(tracing, "PROFILE_DIR", str(tmp_path / "profiles"))
+    headers = {"X-Admin-Token": "secret"}
+    assert client.post(url, params={"trace": True}, json=body, headers={"X-Admin-Token": "wrong"}).status_code == 403
+
+    result = client.post(url, params={"trace": True, "profile": True}, json=body, headers=headers).json()
+    assert result["status"] == "flagged"
+    trace = result["trace"]
+    assert {"db_fetch_ms", "rule_load_ms", "evaluation_ms", "db_save_ms", "total_ms"} <= set(trace["timings"])
+    assert [rule["condition"] for rule in trace["rules"]] == [rule["condition"] for rule in RULES]
+    assert trace["rules"][0]["nodes"][0]["calls"] == 1
+    assert (tmp_path / "profiles").exists() and trace["profile_path"].endswith(".prof")
+
+    # Untraced checks carry no trace
+    assert "trace" not in client.post(url, json=body).json()
+
+
+def test_reference_datasets_in_rules(client):
+    url = f"{BASE_URL}/datasets/sanctioned_countries"
+    saved = client.put(url, json={"description": "Sanctioned countries", "entries": ["North Korea"]}).json()
+    assert saved["size"] == 1 and saved["version"] == 1
+    assert client.get(f"{BASE_URL}/datasets").json()[0]["name"] == "sanctioned_countries"
+    assert client.get(url).json()["entries"] == ["North Korea"]
+    assert client.put(f"{BASE_URL}/datasets/bad name", json={"entries": []}).status_code == 422
+
+    rule = {**RULES[0], "name": "Sanctions Rule", "condition": "destination not in ref('sanctioned_countries')"}
+    assert client.post(f"{BASE_URL}/rules", json=rule).status_code == 200
+
+    consignment_id = client.post(f"{BASE_URL}/consignments", json=make_consignment("north-korea")).json()["id"]
+    check = lambda: client.post(f"{BASE_URL}/compliance/check", json={"consignment_id": consignment_id}).json()
+    assert check()["status"] == "flagged"
+
+    # A new dataset version is picked up on the next check
+    assert client.put(url, json={"entries": ["Belarus"]}).json()["version"] == 2
+    assert check()["status"] == "verified"
+
+    # Rules referencing a missing dataset report an error instead of passing
+    assert client.delete(url).status_code == 204
+    result = check()
+    assert result["status"] == "flagged"
+    assert "Unknown reference dataset" in result["violations"][0]["error"]
+
+
+def export_consignments(client, **params):
+    response = client.get(f"{BASE_URL}/consignments/export", params=params)
+    assert response.status_code == 200
+    return response
+
+
+@pytest.mark.parametrize("backend", ["memory", "sql"])
+def test_export_streams_consignments_with_verdicts(tmp_path, backend):
+    from sqlalchemy import create_engine
+
+    if backend == "sql":
+        engine = create_engine(f"sqlite:///{tmp_path / 'export.db'}")
+        storage = SQLStorage(engine=engine, create_tables=True)
+    else:
+        storage = InMemoryStorage()
+    with TestClient(create_app(storage, AttachmentStore(str(tmp_path)))) as client:
+        client.post(f"{BASE_URL}/rules", json=RULES[0])
+        ids = [
+            client.post(f"{BASE_URL}/consignments", json=make_consignment(destination)).json()["id"]
+            for destination in ["Germany", "Iran", "France"]
+        ]
+        client.post(f"{BASE_URL}/compliance/batch-check", json={"consignment_ids": ids[:2]})
+
+        response = export_consignments(client)
+        assert response.headers["content-type"] == "application/x-ndjson"
+        rows = [json.loads(line) for line in response.text.splitlines()]
+        assert [row["id"] for row in rows] == ids
+        assert [row["status"] for row in rows] == ["verified", "flagged", "pending"]
+        assert rows[1]["violations"][0]["rule_id"] and rows[0]["items"][0]["name"] == "Office Supplies"
+
+        flagged = list(csv.DictReader(io.StringIO(export_consignments(client, format="csv", status="flagged").text)))
+        assert [row["id"] for row in flagged] == [ids[1]]
+        assert json.loads(flagged[0]["violations"])[0]["condition_str"] == RULES[0]["condition"]
+
+        created_at = rows[1]["created_at"]
+        assert len(export_consignments(client, created_from=created_at).text.splitlines()) == 2
+        assert len(export_consignments(client, created_to=created_at).text.splitlines()) == 1
+        # Aware bounds are compared in UTC
+        assert len(export_consignments(client, created_from=created_at + "+00:00").text.splitlines()) == 2
+        assert len(export_consignments(client, created_from=created_at + "+01:00").text.splitlines()) == 3
+        assert client.get(f"{BASE_URL}/consignments/export", params={"format": "xml"}).status_code == 422
+
+
+def test_concurrent_profiling_is_rejected(client, monkeypatch, tmp_path):
+    import main
+    import tracing
+
+    monkeypatch.setattr(main, "ADMIN_TOKEN", "secret")
+    monkeypatch.setattr(tracing, "PROFILE_DIR", str(tmp_path / "profiles"))
+    consignment = client.post(f"{BASE_URL}/consignments", json=make_consignment()).json()
+    request = lambda: client.post(
+        f"{BASE_URL}/compliance/check", params={"profile": True},
+        json={"consignment_id": consignment["id"]}, headers={"X-Admin-Token": "secret"}
+    )
+
+    # Another request holds the profiler
+    with tracing.RequestTrace(profile=True).profiled("other"):
+        response = request()
+    assert response.status_code == 409 and response.headers["Retry-After"] == "1"
+
+    response = request()
+    assert response.status_code == 200 and response.json()["trace"]["profile_scope"] == "process"
+
+
+def test_sql_storage_seeds_the_rule_set_version(tmp_path):
+    from sqlalchemy import create_engine
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'rules.db'}")
+    seeded = SQLStorage(engine=engine, create_tables=True)
+    seeded.open()
+    seeded.close()
+    storage = SQLStorage(engine=engine, create_tables=True)  # a second worker starting on the same database
+    with TestClient(create_app(storage, AttachmentStore(str(tmp_path)))) as client:
+        first = client.get(f"{BASE_URL}/rules").headers["etag"]
+        assert client.post(f"{BASE_URL}/rules", json=RULES[0]).status_code == 200
+        assert client.get(f"{BASE_URL}/rules").headers["etag"] != first
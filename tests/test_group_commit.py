@@ -0,0 +1,133 @@
+import threading
+from concurrent.futures import Future
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from database import Base
+from models import Consignment
+import repository
+from group_commit import GroupCommitter, GroupCommitTimeout
+from repository import SQLRepository
+
+
+@pytest.fixture
+def session_factory(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'group_commit.db'}")
+    Base.metadata.create_all(bind=engine)
+    yield sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    engine.dispose()
+
+
+def seed(session_factory, count):
+    db = session_factory()
+    consignments = [
+        Consignment(status="pending", items=[], destination="Germany", customs_value=10, attachments=[], violations=[])
+        for _ in range(count)
+    ]
+    db.add_all(consignments)
+    db.commit()
+    ids = [consignment.id for consignment in consignments]
+    db.close()
+    return ids
+
+
+def test_concurrent_updates_are_committed_before_futures_resolve(session_factory):
+    ids = seed(session_factory, 20)
+    committer = GroupCommitter(session_factory, interval_ms=20, max_batch=8)
+
+    def submit(consignment_id):
+        committer.submit(consignment_id, "flagged", [{"rule_id": "r1"}]).result(timeout=5)
+
+    threads = [threading.Thread(target=submit, args=(consignment_id,)) for consignment_id in ids]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    db = session_factory()
+    rows = db.query(Consignment).all()
+    assert {row.status for row in rows} == {"flagged"}
+    assert all(row.violations == [{"rule_id": "r1"}] for row in rows)
+    db.close()
+    committer.close()
+
+
+def test_last_update_for_a_consignment_wins_within_a_group(session_factory):
+    [consignment_id] = seed(session_factory, 1)
+    committer = GroupCommitter(session_factory, interval_ms=50)
+
+    first = committer.submit(consignment_id, "flagged", [{"rule_id": "r1"}])
+    second = committer.submit(consignment_id, "verified", [])
+    second.result(timeout=5)
+    first.result(timeout=5)
+
+    db = session_factory()
+    consignment = db.get(Consignment, consignment_id)
+    assert consignment.status == "verified"
+    assert consignment.violations == []
+    db.close()
+    committer.close()
+
+
+def test_close_flushes_pending_updates_and_rejects_new_ones(session_factory):
+    [consignment_id] = seed(session_factory, 1)
+    committer = GroupCommitter(session_factory, interval_ms=1000)
+
+    future = committer.submit(consignment_id, "verified", [])
+    committer.close()
+    assert future.done() and future.exception() is None
+
+    with pytest.raises(RuntimeError):
+        committer.submit(consignment_id, "flagged", [])
+
+
+def test_session_failures_resolve_futures_and_keep_the_writer_running(session_factory):
+    [consignment_id] = seed(session_factory, 1)
+    failures = ["open", "close"]
+
+    def flaky_session_factory():
+        failure = failures.pop(0) if failures else None
+        if failure == "open":
+            raise RuntimeError("cannot connect")
+        session = session_factory()
+        if failure == "close":
+            def close():
+                raise RuntimeError("connection lost")
+            session.close = close
+        return session
+
+    committer = GroupCommitter(flaky_session_factory, interval_ms=1)
+    for message in ("cannot connect", "connection lost"):
+        with pytest.raises(RuntimeError, match=message):
+            committer.submit(consignment_id, "flagged", []).result(timeout=5)
+    committer.submit(consignment_id, "verified", []).result(timeout=5)
+    committer.close()
+
+    db = session_factory()
+    assert db.get(Consignment, consignment_id).status == "verified"
+    db.close()
+
+
+def test_save_verdict_gives_up_after_the_commit_timeout(session_factory, monkeypatch):
+    class StalledCommitter:
+        def submit(self, *args):
+            return Future()
+
+    monkeypatch.setattr(repository, "GROUP_COMMIT_TIMEOUT_S", 0.01)
+    [consignment_id] = seed(session_factory, 1)
+    db = session_factory()
+    repo = SQLRepository(db, StalledCommitter())
+    with pytest.raises(GroupCommitTimeout):
+        repo.save_verdict(db.get(Consignment, consignment_id), "flagged", [])
+
+
+def test_cancelled_futures_do_not_stop_the_writer(session_factory):
+    [consignment_id] = seed(session_factory, 1)
+    committer = GroupCommitter(session_factory, interval_ms=50)
+
+    assert committer.submit(consignment_id, "flagged", []).cancel()
+    committer.submit(consignment_id, "verified", []).result(timeout=5)
+    committer.submit(consignment_id, "flagged", []).result(timeout=5)
+    committer.close()
@@ -0,0 +1,187 @@
+import ast
+
+import pytest
+
+from rule_engine import ComplianceEngine, EvaluationBudget, Rule, RuleEvaluator, compute_item_aggregates
+from schemas import ConsignmentStatus
+
+ITEMS = [
+    {"name": "Laptop", "value": 1200.0, "weight": 2.5, "requires_clearance": False},
+    {"name": "Drone", "value": 3000.0, "weight": 4.0, "requires_clearance": True},
+    {"name": "Laptop", "value": 800.0, "weight": 2.0, "requires_clearance": False},
+]
+
+
+@pytest.mark.parametrize("condition, rewritten", [
+    ("any(item.get('requires_clearance') for item in items)", "any_requires_clearance"),
+    ("any(item['requires_clearance'] for item in items)", "any_requires_clearance"),
+    ("sum(i['value'] for i in items) > 4000", "total_item_value > 4000"),
+    ("sum(i.get('weight') for i in items) < 10", "total_item_weight < 10"),
+    ("max(i['value'] for i in items) < 5000", "max_item_value < 5000"),
+    ("max(i['weight'] for i in items) <= 4", "max_item_weight <= 4"),
+    ("len(items) == 3", "item_count == 3"),
+    ("'Drone' not in [i['name'] for i in items]", "'Drone' not in item_names"),
+    ("'Drone' in {i['name'] for i in items}", "'Drone' in item_names"),
+    ("sum({i['value'] for i in items}) == 5000", "sum({i['value'] for i in items}) == 5000"),
+    ("max({i['weight'] for i in items}) <= 4", "max({i['weight'] for i in items}) <= 4"),
+    ("any({i['requires_clearance'] for i in items})", "any({i['requires_clearance'] for i in items})"),
+])
+def test_item_scans_are_rewritten_to_aggregates(condition, rewritten):
+    assert ast.unparse(RuleEvaluator.compile(condition, True)) == rewritten
+
+    # The rewritten rule must agree with scanning the items directly
+    context = {"items": ITEMS}
+    scanned, _ = RuleEvaluator.evaluate(condition, context)
+    aggregated, _ = RuleEvaluator.evaluate(condition, {**context, **compute_item_aggregates(ITEMS)})
+    assert scanned == aggregated
+
+
+@pytest.mark.parametrize("condition", [
+    "any(i['value'] > 1000 for i in items if i['requires_clearance'])",
+    "sum(i.get('value', 0) for i in items) > 1000",
+])
+def test_filtered_and_defaulted_scans_are_not_rewritten(condition):
+    assert ast.unparse(RuleEvaluator.compile(condition, True)) == ast.unparse(ast.parse(condition).body)
+    assert RuleEvaluator.evaluate(condition, {"items": ITEMS})[0] is True
+
+
+@pytest.mark.parametrize("items, error", [
+    ([{"name": "a"}], True),
+    ([{"name": "a", "value": "5", "weight": 1, "requires_clearance": False}], True),
+    # Names that are not strings are scanned as written rather than aborting the check
+    ([{"name": "a", "value": 6, "weight": 1, "requires_clearance": False},
+      {"name": 42, "value": 6, "weight": 1, "requires_clearance": False}], False),
+    ([{"name": ["a"], "value": 12, "weight": 1, "requires_clearance": False}], False),
+    ("not a list", True),
+])
+def test_malformed_items_fail_item_rules_only(items, error):
+    assert compute_item_aggregates(items) is None
+    engine = ComplianceEngine([
+        Rule("value", "Declared value", "", "customs_value < 10"),
+        Rule("items", "Item value", "", "sum(i['value'] for i in items) < 10"),
+    ])
+    status, violations = engine.check_compliance({"destination": "Germany", "customs_value": 5.0, "items": items})
+    assert status == ConsignmentStatus.FLAGGED
+    assert [violation.rule_id for violation in violations] == ["items"]
+    assert bool(violations[0].error) == error
+
+
+def test_compute_item_aggregates():
+    assert compute_item_aggregates(ITEMS) == {
+        "item_count": 3,
+        "total_item_value": 5000.0,
+        "max_item_value": 3000.0,
+        "total_item_weight": 8.5,
+        "max_item_weight": 4.0,
+        "any_requires_clearance": True,
+        "item_names": ["Drone", "Laptop"],
+    }
+
+
+def test_engine_uses_stored_aggregates():
+    engine = ComplianceEngine([Rule("r1", "Clearance", "Items need clearance", "not any_requires_clearance")])
+    data = {"destination": "Germany", "customs_value": 10.0, "items": ITEMS}
+
+    status, violations = engine.check_compliance(data)
+    assert status == ConsignmentStatus.FLAGGED and violations[0].rule_id == "r1"
+
+    # Stored aggregates take precedence over the items list
+    stored = {**compute_item_aggregates(ITEMS), "any_requires_clearance": False}
+    status, _ = engine.check_compliance({**data, "item_aggregates": stored})
+    assert status == ConsignmentStatus.VERIFIED
+
+
+def test_only_safe_calls_are_allowed():
+    passed, details = RuleEvaluator.evaluate("destination.upper() == 'X'", {"destination": "x"})
+    assert passed is False
+    assert "Unsupported function call" in details[0]["error"]
+
+
+def test_rules_over_budget_are_evaluation_errors():
+    items = [{"name": str(i), "value": i} for i in range(200)]
+    condition = "all(a['value'] >= 0 for a in items for b in items)"
+    nested = "any(a['value'] < 0 for a in items if all(c['value'] >= 0 for c in items))"
+
+    passed, details = RuleEvaluator.evaluate(nested, {"items": items}, EvaluationBudget(max_steps=10000, max_seconds=0))
+    assert passed is False
+    assert "evaluation steps" in details[-1]["error"]
+
+    engine = ComplianceEngine([Rule("r1", "Nested", "Nested scan", nested), Rule("r2", "Value", "Value", "customs_value < 10")])
+    status, violations = engine.check_compliance({"destination": "Germany", "customs_value": 100.0, "items": items * 5})
+    assert status == ConsignmentStatus.FLAGGED
+    assert "budget" in violations[0].error
+    assert violations[1].error is None
+
+    # Multiple generators are rejected outright
+    assert "Unsupported" in RuleEvaluator.evaluate(condition, {"items": items})[1][-1]["error"]
+
+
+def test_step_budget_scales_with_items_for_accepted_rules():
+    items = [{"name": str(i), "value": 1.0, "weight": 1.0, "requires_clearance": False} for i in range(20000)]
+    engine = ComplianceEngine([
+        Rule("r1", "Positive", "", "all(item['value'] > 0 and item['weight'] > 0 for item in items)"),
+        Rule("r2", "Weight", "", "all(item['weight'] <= 1000 for item in items)"),
+    ])
+    status, violations = engine.check_compliance({"destination": "Germany", "customs_value": 10.0, "items": items})
+    assert status == ConsignmentStatus.VERIFIED, violations
+
+
+def test_budget_overruns_alone_leave_the_verdict_pending():
+    items = [{"value": i} for i in range(1000)]
+    nested = "any(a['value'] < 0 for a in items if all(c['value'] >= 0 for c in items))"
+    engine = ComplianceEngine([Rule("r1", "Nested", "Nested scan", nested)])
+    status, violations = engine.check_compliance({"destination": "Germany", "customs_value": 1.0, "items": items})
+    assert status == ConsignmentStatus.PENDING
+    assert "evaluation steps" in violations[0].error
+
+
+@pytest.mark.parametrize("condition", [
+    "len([0] * 200000000) > 0",
+    "len(destination * 100000000) > 0",
+    "len(destination + destination) > 0",
+])
+def test_arithmetic_is_only_allowed_on_numbers(condition):
+    passed, details = RuleEvaluator.evaluate(condition, {"destination": "Germany"})
+    assert passed is False
+    assert "only supported on numbers" in details[-1]["error"]
+
+
+def test_time_budget():
+    items = [{"value": i} for i in range(2000)]
+    nested = "any(a['value'] < 0 for a in items if all(c['value'] >= 0 for c in items))"
+    passed, details = RuleEvaluator.evaluate(nested, {"items": items}, EvaluationBudget(max_steps=0, max_seconds=0.01))
+    assert passed is False
+    assert "evaluation time" in details[-1]["error"]
+
+
+def test_estimate_cost():
+    assert RuleEvaluator.estimate_cost("customs_value > 100") == 3
+    # Rewritten item scans are cheap
+    assert RuleEvaluator.estimate_cost("any(item.get('requires_clearance') for item in items)") == 1
+    big_list = "destination in [" + ", ".join(f"'c{i}'" for i in range(500)) + "]"
+    assert RuleEvaluator.estimate_cost(big_list) > 1000
+    nested = "any(a['value'] > 1 for a in items if all(c['value'] >= 0 for c in items))"
+    assert RuleEvaluator.estimate_cost(nested, assumed_items=100) > 100 * 100
+
+
+def test_trace_marks_short_circuited_nodes():
+    engine = ComplianceEngine([Rule("r1", "Route", "Route", "customs_value > 10 and destination in ['Iran']")])
+    trace = []
+    engine.check_compliance({"destination": "Iran", "customs_value": 1.0, "items": ITEMS}, trace)
+
+    nodes = {node["expression"]: node for node in trace[0]["nodes"]}
+    assert nodes["customs_value > 10"]["calls"] == 1
+    assert nodes["destination in ['Iran']"]["skipped"] is True
+    assert trace[0]["passed"] is False
+
+
+def test_reference_set_matches_normalized_values():
+    from reference_data import ReferenceSet
+
+    countries = ReferenceSet("sanctioned_countries", 1, ["North Korea", "Côte d'Ivoire"])
+    assert "North Korea" in countries
+    assert "  north-korea " in countries
+    assert "cote d'ivoire" not in countries
+    assert "CÔTE D'IVOIRE" in countries
+    assert 42 not in countries and ["North Korea"] not in countries
+    assert len(countries) == 2
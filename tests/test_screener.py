@@ -0,0 +1,57 @@
+import io
+
+from screener import read_records, screen_all
+
+RULES = [
+    {"id": "r1", "condition": "destination not in ['Iran', 'Syria']", "description": "Sanctioned destination"},
+    {"id": "r2", "condition": "customs_value < 50000", "description": "High value", "status": "inactive"},
+]
+
+
+def make_records(count):
+    return [
+        {"id": i, "destination": "Iran" if i % 3 == 0 else "Germany", "customs_value": 60000, "items": []}
+        for i in range(count)
+    ]
+
+
+def test_screen_all_preserves_input_order_across_workers():
+    results = list(screen_all(iter(make_records(50)), RULES, workers=2, chunk_size=7))
+    assert [result["id"] for result in results] == list(range(50))
+    assert [result["status"] for result in results] == ["flagged" if i % 3 == 0 else "verified" for i in range(50)]
+    assert all(len(result["violations"]) == (1 if i % 3 == 0 else 0) for i, result in enumerate(results))
+
+
+def test_invalid_records_are_reported_not_raised():
+    stream = io.StringIO('{"id": 1, "destination": "Germany", "customs_value": 10}\nnot json\n{"id": 3}\n'
+                         'null\n[1]\n5\n')
+    results = list(screen_all(read_records(stream, "ndjson"), RULES))
+    assert results[0] == {"id": 1, "status": "verified", "violations": []}
+    assert "Invalid JSON on line 2" in results[1]["error"]
+    assert results[2]["id"] == 3 and "Invalid consignment" in results[2]["error"]
+    assert [result["error"] for result in results[3:]] == [
+        "Expected a JSON object on line 4, got NoneType",
+        "Expected a JSON object on line 5, got list",
+        "Expected a JSON object on line 6, got int",
+    ]
+
+
+def test_csv_items_are_decoded():
+    stream = io.StringIO('id,destination,customs_value,items\n7,Syria,5,"[{""name"": ""a""}]"\n')
+    [record] = read_records(stream, "csv")
+    assert record["items"] == [{"name": "a"}]
+
+
+def test_reference_datasets_are_available_to_rules():
+    rules = [{"id": "sanctions", "condition": "destination not in ref('sanctioned')"}]
+    records = [{"id": i, "destination": destination, "customs_value": 1, "items": []}
+               for i, destination in enumerate(["Germany", "IRAN", "France"])]
+    results = list(screen_all(iter(records), rules, workers=2, chunk_size=1, datasets={"sanctioned": ["Iran"]}))
+    assert [r["status"] for r in results] == ["verified", "flagged", "verified"]
+
+
+def test_malformed_items_do_not_abort_the_run():
+    records = [{"id": 1, "destination": "Germany", "customs_value": 5, "items": [{"name": "a", "value": "5"}]},
+               {"id": 2, "destination": "Germany", "customs_value": 5, "items": {"name": "a"}}]
+    results = list(screen_all(iter(records), [{"id": "r", "condition": "customs_value < 10"}]))
+    assert [result["status"] for result in results] == ["verified", "verified"]
@@ -0,0 +1,88 @@
+import cProfile
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+# Directory where cProfile dumps of profiled requests are written
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+
+# cProfile hooks into sys.monitoring, which allows one profiler per process
+_PROFILER_LOCK = threading.Lock()
+
+
+class ProfilerBusy(Exception):
+    """Raised when a profiled request arrives while another one is being profiled"""
+
+
+class RequestTrace:
+    """
+    Timing breakdown for a single request.
+
+    When disabled every method is a no-op, so handlers can use it
+    unconditionally.
+    """
+
+    def __init__(self, enabled: bool = False, profile: bool = False):
+        self.enabled = enabled or profile
+        self.profile = profile
+        self.timings: Dict[str, float] = {}
+        # Per-rule breakdown filled in by ComplianceEngine.check_compliance
+        self.rules: Optional[List[Dict[str, Any]]] = [] if enabled else None
+        self.profile_path: Optional[str] = None
+
+    @contextmanager
+    def span(self, name: str) -> Iterator[None]:
+        """Time the enclosed block as `<name>_ms`"""
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[f"{name}_ms"] = round((time.perf_counter() - start) * 1000, 4)
+
+    @contextmanager
+    def profiled(self, label: str) -> Iterator[None]:
+        """
+        Run the enclosed block under cProfile and dump the stats to PROFILE_DIR.
+
+        Only one request can be profiled at a time; raises ProfilerBusy
+        otherwise. The profiler is process-wide, so the dump also covers any
+        other threads that ran meanwhile.
+        """
+        if not self.profile:
+            yield
+            return
+        if not _PROFILER_LOCK.acquire(blocking=False):
+            raise ProfilerBusy("Another request is being profiled")
+        try:
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError as e:
+                # Some other profiling tool holds sys.monitoring
+                raise ProfilerBusy(str(e)) from e
+            try:
+                yield
+            finally:
+                profiler.disable()
+                os.makedirs(PROFILE_DIR, exist_ok=True)
+                self.profile_path = os.path.join(PROFILE_DIR, f"{label}-{uuid.uuid4().hex[:8]}.prof")
+                profiler.dump_stats(self.profile_path)
+        finally:
+            _PROFILER_LOCK.release()
+
+    def report(self) -> Optional[Dict[str, Any]]:
+        if not self.enabled:
+            return None
+        report: Dict[str, Any] = {"timings": self.timings}
+        if self.rules is not None:
+            report["rules"] = self.rules
+        if self.profile_path is not None:
+            report["profile_path"] = self.profile_path
+            report["profile_scope"] = "process"
+        return report